@@ -37,7 +37,8 @@ setup(
         'pygments',
         'pyyaml'],
     extras_require = {
-        'Clipboard Support':  ['pyperclip']
+        'Clipboard Support':  ['pyperclip'],
+        'Zstd Support':       ['zstandard']
     },
     entry_points={
         'console_scripts': [
@@ -0,0 +1,156 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggBytesSearch']
+
+import re
+
+try:
+    from re import _parser as _reParser
+    from re import _constants as _reConstants
+except ImportError: # python < 3.11
+    import sre_parse as _reParser
+    import sre_constants as _reConstants
+
+_C = _reConstants
+_REPEATS = tuple(getattr(_C, op) for op in
+                 ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT') if hasattr(_C, op))
+_ATOMIC  = getattr(_C, 'ATOMIC_GROUP', None)
+# Anchors that behave differently in a single line and in a chunk of lines
+_AT_UNSAFE = (_C.AT_BEGINNING_STRING, _C.AT_END_STRING, _C.AT_NON_BOUNDARY)
+# Categories that include the newline
+_CATEGORY_NEWLINE = (_C.CATEGORY_SPACE, _C.CATEGORY_NOT_DIGIT, _C.CATEGORY_NOT_WORD)
+_CATEGORY_SPACE = (_C.CATEGORY_SPACE, _C.CATEGORY_NOT_SPACE)
+
+def _setHasNewline(items):
+    negate = False
+    found  = False
+    for op, av in items:
+        if op is _C.NEGATE:
+            negate = True
+        elif op is _C.LITERAL:
+            found |= av == 10
+        elif op is _C.RANGE:
+            found |= av[0] <= 10 <= av[1]
+        elif op is _C.CATEGORY:
+            found |= av in _CATEGORY_NEWLINE
+        else:
+            return True
+    return found != negate
+
+def _analyze(items, dotall, spaces):
+    '''
+    Return True if the parsed sequence can match only inside a line
+    and behaves the same in a single line and in a chunk of lines,
+    the space categories used are added to "spaces"
+    '''
+    for op, av in items:
+        if op is _C.LITERAL:
+            if av == 10: return False
+        elif op is _C.NOT_LITERAL:
+            if av != 10: return False
+        elif op is _C.ANY:
+            if dotall: return False
+        elif op is _C.IN:
+            spaces.update(a for o,a in av if o is _C.CATEGORY and a in _CATEGORY_SPACE)
+            if _setHasNewline(av): return False
+        elif op is _C.AT:
+            if av in _AT_UNSAFE: return False
+        elif op is _C.SUBPATTERN:
+            _, addFlags, delFlags, p = av
+            if (addFlags|delFlags) & re.MULTILINE: return False
+            if addFlags & re.DOTALL: dotall = True
+            if delFlags & re.DOTALL: dotall = False
+            if not _analyze(p, dotall, spaces): return False
+        elif op is _C.BRANCH:
+            if not all(_analyze(b, dotall, spaces) for b in av[1]): return False
+        elif op in _REPEATS:
+            if not _analyze(av[2], dotall, spaces): return False
+        elif op is _ATOMIC:
+            if not _analyze(av, dotall, spaces): return False
+        elif op is _C.ASSERT:
+            if not _analyze(av[1], dotall, spaces): return False
+        elif op is _C.GROUPREF_EXISTS:
+            _, yes, no = av
+            if not _analyze(yes, dotall, spaces): return False
+            if no and not _analyze(no, dotall, spaces): return False
+        elif op is _C.GROUPREF:
+            pass
+        else:
+            # Negative lookarounds and anything unknown
+            return False
+    return True
+
+class TloggBytesSearch():
+    '''
+    A (str) regex compiled as bytes regex, matched on whole chunks of
+    ASCII data without decoding them, the match positions are mapped
+    back to the line numbers counting the newlines.
+
+    Only the regexes that can not match a newline and behave the same in
+    a line and in a chunk of lines (multiline mode) are converted,
+    the chunks with non ASCII data are searched decoding the lines
+    (i.e. "." would match a single byte of a multibyte char)
+    '''
+    __slots__ = ('_rr', '_spaces')
+    def __init__(self, rr, spaces):
+        self._rr = rr
+        self._spaces = spaces
+
+    @staticmethod
+    def fromRegex(rr):
+        '''Return the bytes search of a compiled (str) regex, None if it is not possible'''
+        if not rr.pattern.isascii(): return None
+        if rr.flags & re.MULTILINE: return None
+        spaces = set()
+        try:
+            if not _analyze(_reParser.parse(rr.pattern, rr.flags), bool(rr.flags & re.DOTALL), spaces):
+                return None
+            brr = re.compile(rr.pattern.encode(), (rr.flags & ~re.UNICODE) | re.MULTILINE)
+        except Exception:
+            return None
+        return TloggBytesSearch(brr, bool(spaces))
+
+    def search(self, data, line, start=0):
+        '''
+        Return the lines in data[start:] (whole lines numbered from "line")
+        matching the regex, None if the data can not be searched as bytes
+        '''
+        if not data.isascii(): return None
+        # \s include the ASCII separators in the str regexes
+        if self._spaces and any(c in data for c in (b'\x1c',b'\x1d',b'\x1e',b'\x1f')):
+            return None
+        ret = []
+        search = self._rr.search
+        counted = start
+        pos = start
+        while m := search(data, pos):
+            # After the last newline (or in no data) there is no line
+            if m.start() == len(data) and (not data or data.endswith(b'\n')): break
+            start = data.rfind(b'\n', counted, m.start())+1 or counted
+            line += data.count(b'\n', counted, start)
+            counted = start
+            ret.append(line)
+            # One hit for each line, continue from the next one
+            pos = data.find(b'\n', m.start())+1
+            if not pos: break
+        return ret
@@ -0,0 +1,311 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggCompressedIndex', 'TloggCompressedStream']
+
+import io
+import os
+import bz2
+import zlib
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .cfg import TloggCfg
+
+'''
+    Random access to compressed files (zran style)
+
+    Decompressed  |--------|--------|--------|---->
+                  C0       C1       C2       C3
+    Compressed    |---|----|--|---|-----|
+
+    While the file is decompressed (i.e. during the indexing) a checkpoint
+    (decompressed offset, compressed offset, decompressor state) is stored
+    every "compressedCheckpoint" bytes of output,
+    any read start from the closest checkpoint before the requested offset.
+
+    gzip - the zlib decompressor state can be copied, checkpoints are
+           placed every "compressedCheckpoint" bytes and at each member
+    bz2  - the decompressor state cannot be copied, checkpoints are placed
+           only at the beginning of each stream (i.e. pbzip2 files)
+    zstd - (requires "zstandard") same as bz2, checkpoints at each frame
+
+    The decompressed output is also kept in aligned windows of _windowSize
+    bytes, a LRU bounded by "compressedCacheSize" (bytes, default 64M),
+    the reads (i.e. scrolling back) in the recent windows don't decompress
+    again from the checkpoint (the beginning of a single stream bz2/zstd file).
+'''
+class TloggCompressedIndex():
+    GZIP = 'gzip'
+    BZ2  = 'bz2'
+    ZSTD = 'zstd'
+
+    _magic = {
+        GZIP : b'\x1f\x8b',
+        BZ2  : b'BZh',
+        ZSTD : b'\x28\xb5\x2f\xfd'}
+
+    class _Checkpoint():
+        __slots__ = ('output', 'input', 'state')
+        def __init__(self, output, input, state=None):
+            self.output = output
+            self.input  = input
+            self.state  = state
+
+    _windowSize = 0x100000
+
+    __slots__ = ('_filename', '_kind', '_spacing',
+                 '_checkpoints', '_outputs', '_windows', '_maxWindows', '_mutex',
+                 '_size', '_end', '_inputPos', '_inputSize')
+    def __init__(self, filename, kind):
+        self._filename = filename
+        self._kind = kind
+        self._spacing = TloggCfg.options.get('compressedCheckpoint', 0x1000000)
+        self._checkpoints = [TloggCompressedIndex._Checkpoint(0,0)]
+        self._outputs = [0]
+        # window number -> decompressed bytes
+        self._windows = OrderedDict()
+        self._maxWindows = max(1, TloggCfg.options.get('compressedCacheSize', 0x4000000)//self._windowSize)
+        self._mutex = threading.Lock()
+        self._size = 0
+        # The decompressed size once the end of the file has been reached
+        self._end = None
+        self._inputPos = 0
+        self._inputSize = os.stat(filename).st_size
+
+    @staticmethod
+    def detect(filename):
+        '''Return the compression used by the file or None'''
+        try:
+            with open(filename, 'rb') as f:
+                head = f.read(4)
+        except OSError:
+            return None
+        for kind, magic in TloggCompressedIndex._magic.items():
+            if head.startswith(magic):
+                if kind == TloggCompressedIndex.ZSTD and zstandard is None:
+                    return None
+                return kind
+        return None
+
+    def filename(self):
+        return self._filename
+
+    def size(self) -> int:
+        '''The decompressed size seen so far'''
+        return self._size
+
+    def end(self):
+        '''The decompressed size, None if the end of the file has not been reached yet'''
+        return self._end
+
+    def setEnd(self, output):
+        self._end = output
+
+    def progress(self) -> float:
+        return self._inputPos/self._inputSize if self._inputSize else 1.0
+
+    def memoryUsage(self) -> int:
+        return ( len(self._checkpoints) * (0x8000 if self._kind == self.GZIP else 0) +
+                 len(self._windows) * self._windowSize )
+
+    def newDecompressor(self):
+        if self._kind == self.GZIP:
+            return zlib.decompressobj(zlib.MAX_WBITS|32)
+        if self._kind == self.BZ2:
+            return bz2.BZ2Decompressor()
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    def checkpoint(self, output):
+        '''Return the closest checkpoint before the output offset'''
+        with self._mutex:
+            return self._checkpoints[bisect_right(self._outputs, output)-1]
+
+    def update(self, output, input, decompressor=None):
+        '''
+        Called by the streams after each decompressed block,
+        the decompressor is None at the beginning of a new member/stream/frame
+        '''
+        with self._mutex:
+            self._size = max(self._size, output)
+            self._inputPos = max(self._inputPos, input)
+            last = self._outputs[-1]
+            if output <= last: return
+            if decompressor is None:
+                self._checkpoints.append(TloggCompressedIndex._Checkpoint(output, input))
+            elif self._kind == self.GZIP and output >= last + self._spacing:
+                self._checkpoints.append(TloggCompressedIndex._Checkpoint(output, input, decompressor.copy()))
+            else:
+                return
+            self._outputs.append(output)
+
+    def window(self, output):
+        '''Return the cached decompressed bytes from the output offset to the end of its window, None if not cached'''
+        num, pos = divmod(output, self._windowSize)
+        with self._mutex:
+            if (data := self._windows.get(num)) is None: return None
+            self._windows.move_to_end(num)
+        return data[pos:] if pos < len(data) else None
+
+    def keepWindow(self, output, data):
+        '''Store the decompressed window starting at the (aligned) output offset'''
+        with self._mutex:
+            self._windows[output//self._windowSize] = data
+            self._windows.move_to_end(output//self._windowSize)
+            while len(self._windows) > self._maxWindows:
+                self._windows.popitem(last=False)
+
+class TloggCompressedStream(io.RawIOBase):
+    '''
+    Seekable raw stream of the decompressed content
+
+    _pending holds the current block (starting at _pendingStart), the
+    bytes before _pendingPos have been already consumed:
+        tell() = _pendingStart + _pendingPos
+    the next block is taken from the windows cached by the index or
+    decompressed, the decompressor (at _output) is moved forward or
+    restored from the closest checkpoint only when required;
+    the decompressed output is assembled in windows (_window) for the cache.
+    '''
+    _inChunk = 0x10000
+    def __init__(self, index:TloggCompressedIndex):
+        super().__init__()
+        self._index = index
+        self._fd = open(index.filename(), 'rb')
+        self._pending = b''
+        self._pendingStart = 0
+        self._pendingPos = 0
+        self._restore(index.checkpoint(0))
+
+    def close(self):
+        self._fd.close()
+        super().close()
+
+    def readable(self): return True
+    def seekable(self): return True
+    def tell(self):     return self._pendingStart + self._pendingPos
+
+    def _restore(self, cp):
+        self._decompressor = cp.state.copy() if cp.state is not None else self._index.newDecompressor()
+        self._fd.seek(cp.input)
+        self._input   = cp.input
+        self._output  = cp.output
+        self._eof     = False
+        # The window is assembled from the next aligned offset
+        self._window  = None
+        self._windowStart = 0
+
+    def _keep(self, start, block):
+        '''Assemble the block (decompressed from "start") in the cached windows'''
+        size = self._index._windowSize
+        if self._window is None:
+            if (skip := -start % size) >= len(block): return
+            self._window = bytearray(block[skip:])
+            self._windowStart = start+skip
+        else:
+            self._window += block
+        while len(self._window) >= size:
+            self._index.keepWindow(self._windowStart, bytes(self._window[:size]))
+            del self._window[:size]
+            self._windowStart += size
+
+    def _next(self):
+        '''Replace the pending block with the following one, return False at the end of the file'''
+        end = self._pendingStart + len(self._pending)
+        if (size := self._index.end()) is not None and end >= size:
+            return False
+        if (data := self._index.window(end)) is None:
+            if not (self._index.checkpoint(end).output <= self._output <= end):
+                self._restore(self._index.checkpoint(end))
+            while (start := self._output) <= end:
+                if not (data := self._decompress()):
+                    return False
+                if self._output > end:
+                    data = data[end-start:]
+                    break
+        self._pending = data
+        self._pendingStart = end
+        self._pendingPos = 0
+        return True
+
+    def _decompress(self) -> bytes:
+        '''Return the next decompressed block (at _output), empty at the end of the file'''
+        while not self._eof:
+            if not (data := self._fd.read(self._inChunk)):
+                self._eof = True
+                break
+            self._input += len(data)
+            blocks = []
+            checkpoint = True
+            while data:
+                try:
+                    blocks.append(block := self._decompressor.decompress(data))
+                except (zlib.error, OSError, EOFError):
+                    # Trailing garbage (i.e. zero padding)
+                    self._eof = True
+                    break
+                self._output += len(block)
+                if not getattr(self._decompressor, 'eof', False):
+                    break
+                # End of the member/stream/frame, the next one starts with the unused data
+                data = self._decompressor.unused_data
+                self._decompressor = self._index.newDecompressor()
+                self._index.update(self._output, self._input-len(data))
+                checkpoint = False
+            if checkpoint:
+                self._index.update(self._output, self._input, self._decompressor)
+            if block := b''.join(blocks):
+                self._keep(self._output-len(block), block)
+                return block
+        self._index.setEnd(self._output)
+        # The last (partial) window
+        if self._window:
+            self._index.keepWindow(self._windowStart, bytes(self._window))
+            self._window = None
+        return b''
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self.tell()
+        elif whence == io.SEEK_END:
+            while self._next(): pass
+            pos += self._pendingStart + len(self._pending)
+        if not (self._pendingStart <= pos <= self._pendingStart + len(self._pending)):
+            # The block at "pos" is read (cached or decompressed) when required
+            self._pending = b''
+            self._pendingStart = pos
+        self._pendingPos = pos - self._pendingStart
+        return pos
+
+    def readinto(self, b):
+        if self._pendingPos >= len(self._pending) and not self._next():
+            return 0
+        size = min(len(b), len(self._pending)-self._pendingPos)
+        b[:size] = self._pending[self._pendingPos:self._pendingPos+size]
+        self._pendingPos += size
+        return size
@@ -0,0 +1,695 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggFileBuffer']
+
+import io
+import os
+import re
+import mmap
+import time
+import threading
+import multiprocessing
+from array import array
+from bisect import bisect_left
+from itertools import islice, accumulate, chain
+from concurrent.futures import ProcessPoolExecutor
+
+import TermTk as ttk
+
+from .lineindex  import TloggLineIndex, TloggSparseIndex
+from .indexcache import TloggIndexCache
+from .filereader import TloggFileReader
+from .cfg        import TloggCfg
+from .linecache  import TloggLineCache
+from .prefilter  import TloggPrefilter
+from .bytesearch import TloggBytesSearch
+from .searchcache import TloggSearchCache
+from .trigramindex import TloggTrigramIndex
+from .timeindex  import TloggTimeIndex
+
+_chunkSize = 0x1000000 # ~16M
+_rangeSize = 0x4000000 # ~64M, the portion of the file indexed by each worker
+
+def _newlines(chunk, offset) -> array:
+    '''Return the offsets following each newline in chunk'''
+    lines = chunk.split(b'\n')
+    lines.pop()
+    return array('Q', islice(accumulate(map((1).__add__, map(len, lines)), initial=offset), 1, None))
+
+def _indexRange(filename, start, end) -> array:
+    '''Worker, return the offsets following each newline in the [start,end) range'''
+    ret = array('Q')
+    with open(filename,'rb') as infile:
+        infile.seek(start)
+        while start < end and (chunk:=infile.read(min(_chunkSize, end-start))):
+            ret.extend(_newlines(chunk, start))
+            start += len(chunk)
+    return ret
+
+def _decodeLines(data, start=0):
+    '''Return the decoded lines in data[start:]'''
+    stream = io.BytesIO(data)
+    stream.seek(start)
+    return io.TextIOWrapper(stream, encoding='utf-8', errors='replace', newline='\n')
+
+def _searchLines(rr, data, line, start=0) -> list:
+    '''Return the lines in data[start:] (numbered from "line") matching the compiled regex'''
+    return [i for i,l in enumerate(_decodeLines(data, start), line) if rr.search(l)]
+
+def _searchData(rr, bytesSearch, prefilter, data, line) -> list:
+    '''Return the lines in data (whole lines numbered from "line") matching the compiled regex'''
+    ret, start = [], 0
+    if prefilter is not None:
+        ret, line, start = prefilter.search(rr, data, line)
+    if start < len(data):
+        if bytesSearch is None or (hits := bytesSearch.search(data, line, start)) is None:
+            hits = _searchLines(rr, data, line, start)
+        ret += hits
+    return ret
+
+def _searchMulti(searchers, data, line) -> list:
+    '''
+    Return the lines in data (whole lines numbered from "line") matching
+    each of the searchers (compiled regex, bytesSearch, prefilter),
+    the regexes without a faster path share the decoded lines
+    '''
+    ret, plain = [], []
+    for rr, bytesSearch, prefilter in searchers:
+        if bytesSearch is None and prefilter is None:
+            ret.append(hits := [])
+            plain.append((hits, rr))
+        else:
+            ret.append(_searchData(rr, bytesSearch, prefilter, data, line))
+    if len(plain) == 1:
+        hits, rr = plain[0]
+        hits += _searchLines(rr, data, line)
+    elif plain:
+        plain = [(hits, rr.search) for hits, rr in plain]
+        for n,l in enumerate(_decodeLines(data), line):
+            for hits, search in plain:
+                if search(l):
+                    hits.append(n)
+    return ret
+
+def _searchRange(filename, searchers, line, start, end) -> list:
+    '''Worker, return the lines matching each searcher in the [start,end) range beginning with "line"'''
+    with open(filename,'rb') as infile:
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _searchMulti(searchers, mm[start:end], line)
+
+class TloggFileBuffer():
+    '''
+    The decoded lines are stored in the shared TloggLineCache:
+    single lines if the file is memory mapped (only the drawn lines are decoded),
+    pages of _window lines read at once otherwise.
+    '''
+    _window = 0x100
+
+    __slots__ = (
+        '_indexes', '_indexesMutex',
+        '_filename', '_reader', '_cacheId',
+        '_size', '_inode', '_indexing', '_sparse', '_trigrams', '_times', '_timesMutex',
+        #Signals
+        'indexUpdated', 'indexed', 'appended', 'reloaded')
+    def __init__(self, filename):
+        # Signals
+        self.indexUpdated = ttk.pyTTkSignal(float)
+        self.indexed = ttk.pyTTkSignal()
+        # Emitted by refresh() with the number of lines before the append
+        self.appended = ttk.pyTTkSignal(int)
+        # Emitted when the file has been rotated or truncated and the index rebuilt
+        self.reloaded = ttk.pyTTkSignal()
+
+        self._filename = filename
+        self._indexes = TloggLineIndex([0])
+        self._indexesMutex = threading.Lock()
+        self._size=0
+        self._indexing=True
+        self._sparse=None
+        self._trigrams=None
+        self._times = TloggTimeIndex.fromOptions()
+        self._timesMutex = threading.Lock()
+        self._cacheId = TloggLineCache.newOwner()
+        self._reader = TloggFileReader.open(self._filename)
+        self._inode = self._reader.inode()
+        threading.Thread(target=self.createIndex).start()
+
+    def __del__(self):
+        self._reader.close()
+        TloggLineCache.invalidate(self._cacheId)
+        TloggSearchCache.invalidate(self._cacheId)
+
+    def filename(self):
+        return self._filename
+
+    def getLen(self):
+        return self._length(self._sparse)
+
+    def _length(self, sparse):
+        # "sparse" is a snapshot, the indexing sets _sparse to None once completed
+        if sparse is not None and sparse.active(self._size):
+            return sparse.estimate(len(self._indexes), self._size)
+        return len(self._indexes)
+
+    def getIndexedLen(self):
+        '''Return the number of lines indexed (the ones searched)'''
+        return len(self._indexes)
+
+    def isIndexing(self):
+        '''Return True while the file is (re)indexed'''
+        return self._indexing
+
+    def isExact(self):
+        '''Return False if the line count/numbers are still estimated'''
+        return self._sparse is None
+
+    def getWidth(self, indexes=None):
+        '''Return the max width of the file or (upper bound) of the sorted list of "indexes"'''
+        with self._indexesMutex:
+            lineIndex = self._indexes
+        # The index is only extended while scanning, no need to stall the appends
+        return lineIndex.maxWidth(indexes)
+
+    def indexMemoryUsage(self) -> (int, float):
+        '''Return the bytes used by the line index and the bytes per line'''
+        return self._indexes.memoryUsage(), self._indexes.bytesPerLine()
+
+    def _lineRange(self, line):
+        with self._indexesMutex:
+            start = self._indexes[line]
+            end = self._indexes[line+1] if line+1 < len(self._indexes) else None
+        return start, end
+
+    def _readLines(self, line, lines) -> str:
+        # The end of the last line is not indexed,
+        # it is read up to the newline or the end of the file
+        if line+lines < len(self._indexes):
+            start,_ = self._lineRange(line)
+            end,_   = self._lineRange(line+lines)
+            return self._reader.readText(start, end)
+        start,_ = self._lineRange(line)
+        last,_  = self._lineRange(len(self._indexes)-1)
+        return self._reader.readText(start, last) + self._reader.readText(last)
+
+    def _getSparseLine(self, sparse, line):
+        # Read a line not indexed yet (the file is still indexing)
+        offset, exact = sparse.offset(line, len(self._indexes), self._size)
+        if not exact and offset > 0:
+            # Resync to the beginning of the next line
+            offset += len(self._reader.read(offset-1))-1
+        return self._reader.readText(offset)
+
+    def _cacheKey(self, line):
+        return line if self._reader.mapped else ('page', line//self._window)
+
+    def getLine(self, line):
+        sparse = self._sparse
+        if line >= self._length(sparse):
+            return ""
+        if line >= len(self._indexes):
+            return self._getSparseLine(sparse, line).replace('\r','')
+        key = self._cacheKey(line)
+        if self._reader.mapped:
+            if (ret := TloggLineCache.get(self._cacheId, key)) is None:
+                ret = self._reader.readText(*self._lineRange(line)).replace('\r','')
+                TloggLineCache.put(self._cacheId, key, ret)
+            return ret
+        first = line-line%self._window
+        page = TloggLineCache.get(self._cacheId, key)
+        # The page may have been read while it was partially indexed
+        if page is None or line-first >= len(page):
+            # Read the whole page at once
+            lines = min(self._window, len(self._indexes)-first)
+            text = self._readLines(first, lines).replace('\r','')
+            # The last chunk of the split is the only one without newline
+            text = text.split('\n')
+            page = [text[i] + ('\n' if i < len(text)-1 else '') for i in range(lines)]
+            TloggLineCache.put(self._cacheId, key, page)
+        return page[line-first]
+
+    def _appendIndexes(self, indexes):
+        with self._indexesMutex:
+            self._indexes.extend(indexes)
+
+    def _lineHead(self, line) -> str:
+        '''Return the beginning of the line (where the timestamp is)'''
+        start, end = self._lineRange(line)
+        maxEnd = start + TloggTimeIndex._maxLength
+        return self._reader.readText(start, maxEnd if end is None else min(end, maxEnd))
+
+    def _sampleTimes(self, wait=True):
+        '''
+        Sample the timestamps of the indexed lines not sampled yet,
+        out of the indexing (after indexed/appended), if not "wait"
+        the lines are left to the sampling already running
+        '''
+        # Random reads are expensive in the compressed files, not sampled
+        if (times := self._times) is None or self._reader.compressed: return
+        if not self._timesMutex.acquire(blocking=wait): return
+        try:
+            # Only the complete lines, a reload replaces the index
+            while ( times is self._times and
+                    (line := times.nextSample()) is not None and
+                    line < len(self._indexes)-1 ):
+                times.add(line, self._lineHead(line))
+        finally:
+            self._timesMutex.release()
+
+    def timeIndex(self):
+        '''Return the sparse TloggTimeIndex, None if disabled'''
+        return self._times
+
+    def timeToLine(self, time):
+        '''
+        Return the first indexed line with a timestamp >= time
+        (the indexed lines if all of them are earlier),
+        None if no timestamps are available
+        '''
+        if (times := self._times) is None or not len(times): return None
+        first, last, ref = times.bracket(time)
+        end = len(self._indexes) if last is None else last
+        for line in range(first, end):
+            if (t := times.time(self._lineHead(line), ref)) is not None and t >= time:
+                return line
+        return end
+
+    def timeWindow(self, fromTime=None, toTime=None):
+        '''Return the [start,end) lines with the timestamps in [fromTime,toTime), None if not available'''
+        if (times := self._times) is None or not len(times): return None
+        start = 0 if fromTime is None else self.timeToLine(fromTime)
+        end = len(self._indexes) if toTime is None else self.timeToLine(toTime)
+        return start, max(start, end)
+
+    @staticmethod
+    def _indexWorkers() -> int:
+        return TloggCfg.options.get('indexWorkers', os.cpu_count() or 1)
+
+    @staticmethod
+    def _searchWorkers() -> int:
+        return TloggCfg.options.get('searchWorkers', os.cpu_count() or 1)
+
+    @staticmethod
+    def _chunks(infile, offset):
+        infile.seek(offset)
+        while (chunk:=infile.read(_chunkSize)):
+            yield _newlines(chunk, offset), offset+len(chunk)
+            offset+=len(chunk)
+
+    def _ranges(self, offset, fileSize, workers):
+        '''
+        Split the file in byte ranges indexed in a process pool,
+        the partial indexes are returned in order to be stitched together
+        '''
+        ranges = [(s, min(s+_rangeSize, fileSize)) for s in range(offset, fileSize, _rangeSize)]
+        # The workers are forked, the spawned ones would require to
+        # re-import TermTk which does not work without a terminal
+        ctx = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(min(workers,len(ranges)), mp_context=ctx) as pool:
+            for (_,end),indexes in zip(ranges, pool.map(_indexRange,
+                                                         [self._filename]*len(ranges),
+                                                         *zip(*ranges))):
+                yield indexes, end
+
+    def _scan(self, reader, infile, offset, progress=False, index=None):
+        '''
+        Index all the newlines from offset to the end of the file,
+        the offsets are added to "index" if provided or to the live index
+        '''
+        def _add(indexes, end):
+            if index is None:
+                self._appendIndexes(indexes)
+                self._size = end
+            else:
+                index.extend(indexes)
+            if progress:
+                self.indexUpdated.emit(reader.progress(end))
+            return end
+
+        workers = self._indexWorkers()
+        fileSize = reader.size()
+        if ( not reader.compressed and
+             fileSize-offset > _rangeSize and workers > 1 and
+             'fork' in multiprocessing.get_all_start_methods() ):
+            for indexes, end in self._ranges(offset, fileSize, workers):
+                offset = _add(indexes, end)
+        # Index sequentially what is left (or what has been appended in the meantime)
+        for indexes, end in self._chunks(infile, offset):
+            offset = _add(indexes, end)
+        return offset
+
+    def createIndex(self):
+        offset = 0
+        # Reuse the persistent index if the file is unchanged
+        # or only the tail added since the last time
+        # (compressed files require the decompressor checkpoints, not cached)
+        compressed = self._reader.compressed
+        if not compressed and (cached := TloggIndexCache.load(self._filename)):
+            cachedIndexes, offset = cached
+            with self._indexesMutex:
+                self._indexes = cachedIndexes
+            self._size = offset
+            # The time samples stored with the index, if any
+            if self._times is not None and (times := TloggTimeIndex.load(self._filename, offset)) is not None:
+                self._times = times
+            ttk.TTkLog.debug(f"Index Cache: {self._filename} {offset} bytes reused")
+            self.indexUpdated.emit(self._reader.progress(offset))
+        # The first and last screens are available immediately
+        # through an approximate index while the full one is built
+        if not compressed:
+            self._sparse = self._sparseIndex(offset)
+        with self._reader.stream() as infile:
+            offset = self._scan(self._reader, infile, offset, True)
+        self._sparse = None
+        if not compressed:
+            TloggIndexCache.save(self._filename, self._indexes, offset)
+        ttk.TTkLog.debug(f"Index: {self._filename} {len(self._indexes)} lines, "
+                         f"{self._indexes.memoryUsage()} bytes, "
+                         f"{self._indexes.bytesPerLine():.2f} bytes/line")
+        self._indexing = False
+        self.indexUpdated.emit(1.0)
+        self.indexed.emit()
+        self._saveTimes(offset)
+        self._trigramIndex()
+
+    def _saveTimes(self, offset):
+        '''Sample the lines (up to "offset") not sampled yet and store the samples'''
+        self._sampleTimes()
+        if (times := self._times) is not None and not self._reader.compressed:
+            times.save(self._filename, offset)
+
+    def _trigramIndex(self):
+        '''
+        Load or build (in background) the trigram index of the complete lines,
+        if enabled, only the blocks appended since it was stored are indexed
+        '''
+        if not TloggTrigramIndex.enabled() or self._reader.compressed: return
+        # The last line may be partial
+        lines = len(self._indexes)-1
+        with self._indexesMutex:
+            size = self._indexes[lines]
+        if size < TloggTrigramIndex._minSize: return
+        blockSize = TloggTrigramIndex.blockSize()
+        trigrams = TloggTrigramIndex.load(self._filename)
+        if trigrams is None or trigrams.lineCount() > lines:
+            start = time.time()
+            ranges = self._searchRanges(0, lines, blockSize)
+            trigrams = TloggTrigramIndex.build(
+                            self._filename,
+                            [r[1] for r in ranges] + [size],
+                            [r[0] for r in ranges] + [lines],
+                            self._indexWorkers())
+            trigrams.save(self._filename)
+            ttk.TTkLog.debug(f"Trigram Index: {self._filename} {trigrams.blockCount()} blocks, "
+                             f"{trigrams.memoryUsage()} bytes, {time.time()-start:.2f}s")
+        elif trigrams.size()+blockSize <= size:
+            start = time.time()
+            blocks = trigrams.blockCount()
+            ranges = self._searchRanges(trigrams.lineCount(), lines, blockSize)
+            trigrams = trigrams.extend(
+                            self._filename,
+                            [r[1] for r in ranges] + [size],
+                            [r[0] for r in ranges] + [lines],
+                            self._indexWorkers())
+            trigrams.save(self._filename)
+            ttk.TTkLog.debug(f"Trigram Index: {self._filename} {trigrams.blockCount()-blocks} blocks appended, "
+                             f"{time.time()-start:.2f}s")
+        self._trigrams = trigrams
+
+    def _sparseIndex(self, offset):
+        sample = TloggSparseIndex._sample
+        fileSize = self._reader.size()
+        if fileSize - offset < 4*sample: return None
+        tailStart = fileSize - sample
+        with self._reader.stream() as infile:
+            infile.seek(offset)
+            head = infile.read(sample)
+            infile.seek(tailStart)
+            tail = _newlines(infile.read(sample), tailStart)
+        if not tail: return None
+        return TloggSparseIndex(head, tail, tail[0], fileSize-tail[0])
+
+    def _reloadIndex(self):
+        # Build the new index aside, the old one (and its reader)
+        # keep serving the view until the swap
+        reader = TloggFileReader.open(self._filename)
+        index = TloggLineIndex([0])
+        with reader.stream() as infile:
+            offset = self._scan(reader, infile, 0, True, index)
+        oldReader = self._reader
+        self._trigrams = None
+        with self._indexesMutex:
+            self._reader  = reader
+            self._inode   = reader.inode()
+            self._indexes = index
+            self._size    = offset
+            self._times   = TloggTimeIndex.fromOptions()
+        oldReader.close()
+        TloggLineCache.invalidate(self._cacheId)
+        TloggSearchCache.invalidate(self._cacheId)
+        if not reader.compressed:
+            TloggIndexCache.save(self._filename, self._indexes, offset)
+        self._indexing = False
+        self.reloaded.emit()
+        self.indexUpdated.emit(1.0)
+        self.indexed.emit()
+        self._saveTimes(offset)
+        self._trigramIndex()
+
+    def reload(self):
+        '''Rebuild the index in background, the current one is used until it is ready'''
+        self._indexing = True
+        threading.Thread(target=self._reloadIndex).start()
+
+    def refresh(self, follow=True):
+        '''
+        Check the file for changes using only stat calls:
+
+        * truncated  - the index is rebuilt in background
+        * rotated    - (inode changed) the new file is indexed in background
+        * appended   - if follow, only the appended data is indexed,
+                       the cost is proportional to the appended bytes.
+        '''
+        if self._indexing: return
+        if self._reader.size() < self._size:
+            ttk.TTkLog.info(f"File truncated: {self._filename}")
+            return self.reload()
+        try:
+            stat = os.stat(self._filename)
+        except OSError:
+            # Rotated away, the new file is not there yet
+            return
+        if stat.st_ino != self._inode:
+            ttk.TTkLog.info(f"File rotated: {self._filename}")
+            return self.reload()
+        # Compressed archives are not followed
+        if not follow or self._reader.compressed: return
+        if stat.st_size <= self._size: return
+        oldLen = len(self._indexes)
+        with self._reader.stream() as infile:
+            self._scan(self._reader, infile, self._size)
+        # The last line may have been partial, drop its cached line/page
+        TloggLineCache.invalidate(self._cacheId, self._cacheKey(oldLen-1))
+        self.appended.emit(oldLen)
+        # Left to the initial sampling if still running
+        self._sampleTimes(wait=False)
+
+    def _textStream(self):
+        return io.TextIOWrapper(self._reader.stream(), encoding='utf-8', errors='replace', newline='\n')
+
+    def searchReBatches(self, regex, ignoreCase=False, start=0, batch=0x10000, lines=None, pool=None, end=None):
+        '''
+        Generator, yield the matching lines and the progress (0.0-1.0)
+        every "batch" lines searched, starting from "start" up to "end"
+        (i.e. the lines of a time window, see timeWindow).
+
+        If "lines" (sorted) is provided only those lines are searched,
+        i.e. the results of a broader search.
+
+        Only the lines indexed when the search starts are included,
+        the caller can stop the search between batches.
+
+        The results are cached (TloggSearchCache), the cached lines are not
+        searched again, only the ones appended in the meantime.
+
+        If "pool" (a forked process pool) is provided, the file is searched
+        in its workers, i.e. shared by the searches of many files.
+        '''
+        rr = re.compile(regex, re.IGNORECASE if ignoreCase else 0)
+        ttk.TTkLog.debug(f"Search RE: {regex}")
+        full = len(self._indexes)
+        end = full if end is None else min(end, full)
+        if start >= end: return
+        # The hits of the lines before "start", None if unknown (not cached)
+        known = array('Q') if start == 0 else None
+        if (cached := TloggSearchCache.get(self._cacheId, regex, ignoreCase, self._inode)) is not None:
+            cachedHits, cachedEnd = cached
+            # The last cached line may have been partial
+            cachedEnd -= 1
+            if end <= cachedEnd:
+                # The whole window is cached
+                yield cachedHits[bisect_left(cachedHits, start):bisect_left(cachedHits, end)].tolist(), 1.0
+                return
+            if start <= cachedEnd <= end:
+                known = cachedHits[:bisect_left(cachedHits, cachedEnd)]
+                yield known[bisect_left(known, start):].tolist(), cachedEnd/end
+                start, lines = cachedEnd, None
+        maxHits = TloggSearchCache.budget()//8
+        for (indexes,), progress in self._searchReBatches([rr], start, end, batch, lines, pool):
+            if known is not None:
+                known.extend(indexes)
+                # Too many hits to be cached
+                if len(known) > maxHits:
+                    known = None
+            yield indexes, progress
+        # Only the searches up to the last indexed line are cached
+        if known is not None and end == full:
+            TloggSearchCache.put(self._cacheId, regex, ignoreCase, self._inode, known, end)
+
+    def searchFiltersBatches(self, regexes, ignoreCase=False, batch=0x10000, start=0, end=None):
+        '''
+        Generator, search all the regexes (i.e. the predefined filters)
+        in a single pass of the lines [start,end), yield a dict with
+        the lines matching each regex and the progress (0.0-1.0)
+
+        The cached regexes are not searched again (see searchReBatches)
+        '''
+        rrs = {}
+        for regex in dict.fromkeys(regexes):
+            if TloggSearchCache.get(self._cacheId, regex, ignoreCase, self._inode) is not None:
+                yield {regex:list(chain.from_iterable(
+                    indexes for indexes,_ in self.searchReBatches(regex, ignoreCase, start, end=end)))}, 0.0
+            else:
+                rrs[regex] = re.compile(regex, re.IGNORECASE if ignoreCase else 0)
+        full = len(self._indexes)
+        end = full if end is None else min(end, full)
+        if not rrs or start >= end: return
+        # Only the whole file searches are cached
+        known = {regex:array('Q') if (start, end) == (0, full) else None for regex in rrs}
+        maxHits = TloggSearchCache.budget()//8
+        for hits, progress in self._searchReBatches(list(rrs.values()), start, end, batch, None):
+            yield dict(zip(rrs, hits)), progress
+            for regex, indexes in zip(rrs, hits):
+                if (k := known[regex]) is not None:
+                    k.extend(indexes)
+                    if len(k) > maxHits:
+                        known[regex] = None
+        for regex, k in known.items():
+            if k is not None:
+                TloggSearchCache.put(self._cacheId, regex, ignoreCase, self._inode, k, end)
+
+    def _searchReBatches(self, rrs, start, end, batch, lines, pool=None):
+        '''Yield the lines matching each of the compiled regexes and the progress'''
+        # Random reads are expensive in the compressed files,
+        # those are scanned sequentially anyway
+        if lines is not None and not self._reader.compressed:
+            lines = lines[bisect_left(lines,start):bisect_left(lines,end)]
+            for pos in range(0, len(lines), batch):
+                texts = [(i, self._reader.readText(*self._lineRange(i))) for i in lines[pos:pos+batch]]
+                yield ( [[i for i,text in texts if rr.search(text)] for rr in rrs],
+                        min(1.0, (pos+batch)/len(lines)) )
+            return
+        # The regex is matched on the raw (ASCII) chunks if possible,
+        # otherwise evaluated only on the decoded lines
+        # containing the required literals (if any)
+        searchBytes = TloggCfg.options.get('searchBytes', True)
+        searchPrefilter = TloggCfg.options.get('searchPrefilter', True)
+        searchers = [( rr,
+                       TloggBytesSearch.fromRegex(rr) if searchBytes else None,
+                       TloggPrefilter.fromRegex(rr) if searchPrefilter else None ) for rr in rrs]
+        # Only the blocks of the trigram index that may contain a match
+        # (and the lines not indexed yet) are searched
+        runs = None
+        if ( lines is None and (trigrams := self._trigrams) is not None and
+             (blocks := trigrams.candidates(rrs)) is not None ):
+            runs = trigrams.runs(blocks, start, end)
+        # Big files are split in ranges of lines searched in a process pool,
+        # the line ends (\n) are the same used by the text stream
+        if lines is None and self._reader.mapped and pool is not None:
+            yield from self._searchParallel(searchers, self._searchRanges(start, end, runs=runs), pool)
+            return
+        if ( lines is None and self._reader.mapped and
+             (workers := self._searchWorkers()) > 1 and
+             'fork' in multiprocessing.get_all_start_methods() and
+             len(ranges := self._searchRanges(start, end, runs=runs)) > 1 ):
+            # The pool is not waited at the exit (i.e. the search is cancelled)
+            pool = ProcessPoolExecutor(min(workers,len(ranges)), mp_context=multiprocessing.get_context('fork'))
+            try:
+                yield from self._searchParallel(searchers, ranges, pool)
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+            return
+        # Each chunk is read once for all the regexes
+        if ( not self._reader.compressed and
+             (runs is not None or len(searchers) > 1 or any(b or p for _,b,p in searchers)) ):
+            ranges = self._searchRanges(start, end, _chunkSize, runs)
+            for i,(line, startOffset, endOffset) in enumerate(ranges,1):
+                yield ( _searchMulti(searchers, self._reader.read(startOffset, endOffset), line),
+                        i/len(ranges) )
+            return
+        with self._textStream() as infile:
+            with self._indexesMutex:
+                infile.seek(self._indexes[start])
+            for pos in range(start, end, batch):
+                size = min(batch, end-pos)
+                texts = list(islice(infile,size))
+                yield ( [[i for i,line in enumerate(texts,pos) if rr.search(line)] for rr in rrs],
+                        (pos+size-start)/(end-start) )
+
+    def _searchRanges(self, start, end, size=_rangeSize, runs=None):
+        '''
+        Split the lines [start,end) in ranges of ~size bytes aligned to the lines,
+        return the (firstLine, startOffset, endOffset) of each range
+
+        If "runs" is provided only the [first,last) runs of lines are split
+        '''
+        if runs is not None:
+            return [r for first,last in runs for r in self._searchRanges(first, last, size)]
+        index = self._indexes
+        ranges = []
+        while start < end:
+            offset = index[start]
+            # The first line beginning after the range size
+            nextLine = bisect_left(index, offset+size, start+1, end)
+            if nextLine < end:
+                ranges.append((start, offset, index[nextLine]))
+            else:
+                # The last line is not terminated in the index
+                last = index[end-1]
+                ranges.append((start, offset, last+len(self._reader.read(last))))
+            start = nextLine
+        return ranges
+
+    def _searchParallel(self, searchers, ranges, pool):
+        # The pending ranges are dropped if the search is stopped
+        futures = [pool.submit(_searchRange, self._filename, searchers, *r) for r in ranges]
+        try:
+            for i,future in enumerate(futures,1):
+                yield future.result(), i/len(futures)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def searchRe(self, regex, ignoreCase=False, start=0, end=None):
+        '''Return the indexed lines, in [start,end), matching the regex'''
+        return list(chain.from_iterable(
+            indexes for indexes,_ in self.searchReBatches(regex, ignoreCase, start, end=end)))
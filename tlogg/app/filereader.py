@@ -0,0 +1,164 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggFileReader', 'TloggMmapReader', 'TloggCompressedReader']
+
+import io
+import os
+import mmap
+import threading
+
+from .cfg import TloggCfg
+from .compressed import TloggCompressedIndex, TloggCompressedStream
+
+class TloggFileReader():
+    '''
+    Buffered reader, used for the files that cannot be memory mapped
+    (pipes, empty files, some network filesystems)
+    '''
+    mapped = False
+    compressed = False
+    __slots__ = ('_filename', '_fd', '_mutex')
+    def __init__(self, filename):
+        self._filename = filename
+        self._mutex = threading.Lock()
+        self._fd = open(filename, 'rb')
+
+    def close(self):
+        self._fd.close()
+
+    def read(self, start, end=None) -> bytes:
+        '''Return the bytes between start and end, if end is None read up to the end of the line'''
+        with self._mutex:
+            self._fd.seek(start)
+            if end is None:
+                return self._fd.readline()
+            return self._fd.read(end-start)
+
+    def readText(self, start, end=None) -> str:
+        return self.read(start, end).decode('utf-8', errors='replace')
+
+    def size(self) -> int:
+        return os.fstat(self._fd.fileno()).st_size
+
+    def inode(self) -> int:
+        return os.fstat(self._fd.fileno()).st_ino
+
+    def progress(self, offset) -> float:
+        '''The indexing progress when offset has been reached'''
+        return min(1.0, offset/size) if (size:=self.size()) else 1.0
+
+    def stream(self):
+        '''Return a new binary stream of the (decompressed) file content'''
+        return open(self._filename, 'rb')
+
+    @staticmethod
+    def open(filename):
+        '''
+        Return the compressed reader for gzip/bz2/zstd files,
+        the mmap backed reader if possible, the buffered one otherwise
+        '''
+        if kind := TloggCompressedIndex.detect(filename):
+            return TloggCompressedReader(filename, kind)
+        if TloggCfg.options.get('mmap', True):
+            try:
+                return TloggMmapReader(filename)
+            except (OSError, ValueError):
+                pass
+        return TloggFileReader(filename)
+
+class TloggMmapReader(TloggFileReader):
+    '''
+    Zero copy reader, the lines are sliced and decoded straight from the mapped file
+    '''
+    mapped = True
+    __slots__ = ('_mm')
+    def __init__(self, filename):
+        super().__init__(filename)
+        try:
+            self._mm = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self._fd.close()
+            raise
+
+    def close(self):
+        self._mm.close()
+        super().close()
+
+    def _remap(self, size):
+        # The file grew after it was mapped, the readers may still be using
+        # the previous map (slices, memoryviews), it is not closed but only
+        # replaced, it is released when the last reader drops it
+        with self._mutex:
+            if size > len(self._mm):
+                self._mm = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._mm
+
+    def _end(self, start, end):
+        '''Return the map to be used by the reader and the end of the range'''
+        # Never touch the mapped pages beyond the end of the file,
+        # if the file has been truncated they would raise a SIGBUS
+        mm = self._mm
+        size = self.size()
+        if size > len(mm):
+            mm = self._remap(size)
+        size = min(size, len(mm))
+        if end is None:
+            if (end := mm.find(b'\n', start, size)) == -1:
+                return mm, max(start, size)
+            return mm, end+1
+        return mm, max(start, min(end, size))
+
+    def read(self, start, end=None) -> bytes:
+        mm, end = self._end(start, end)
+        return mm[start:end]
+
+    def readText(self, start, end=None) -> str:
+        mm, end = self._end(start, end)
+        with memoryview(mm) as mv, mv[start:end] as line:
+            return str(line, 'utf-8', 'replace')
+
+class TloggCompressedReader(TloggFileReader):
+    '''
+    Reader of gzip/bz2/zstd files, any read decompress only from the
+    closest checkpoint, no decompressed copy of the file is required
+    '''
+    compressed = True
+    __slots__ = ('_index', '_inode')
+    def __init__(self, filename, kind):
+        self._filename = filename
+        self._mutex = threading.Lock()
+        self._index = TloggCompressedIndex(filename, kind)
+        self._inode = os.stat(filename).st_ino
+        self._fd = self.stream()
+
+    def size(self) -> int:
+        return self._index.size()
+
+    def inode(self) -> int:
+        return self._inode
+
+    def progress(self, offset) -> float:
+        return self._index.progress()
+
+    def stream(self):
+        return io.BufferedReader(TloggCompressedStream(self._index), 0x100000)
@@ -22,30 +22,38 @@
 
 __all__ = ['FileViewer','FileViewerSearch','FileViewerArea']
 
+from collections import OrderedDict
+
 import TermTk as ttk
 
 from tlogg import TloggHelper, tloggProxy
 
 from . import TloggCfg
+from .hitset import TloggHitSet
+from .highlighter import TloggHighlighter
 
 class FileViewer(ttk.TTkAbstractScrollView):
     __slots__ = (
         '_fileBuffer', '_indexesMark', '_indexesSearched',
-        '_selected', '_indexing', '_searchRe',
-        '_selection', '_pressed'
+        '_selected', '_indexing', '_searching', '_searchRe',
+        '_selection', '_pressed', '_rendered',
         # Signals
-        'selected', 'marked')
+        'selected', 'marked', 'markToggled')
     def __init__(self, *args, **kwargs):
-        self._indexesMark = []
-        self._indexesSearched = []
+        self._indexesMark = TloggHitSet()
+        self._indexesSearched = TloggHitSet()
         self._indexing = None
+        self._searching = None
         self._selected = -1
         self._selection = None
         self._pressed = False
         self._searchRe = ""
+        # LRU of the rendered lines, {lineNum: [key, color, prefix, line, ox, printLine]}
+        self._rendered = OrderedDict()
         # Signals
         self.selected = ttk.pyTTkSignal(int)
-        self.marked = ttk.pyTTkSignal(list)
+        self.marked = ttk.pyTTkSignal(TloggHitSet)
+        self.markToggled = ttk.pyTTkSignal(int)
         self._fileBuffer = kwargs.get('filebuffer')
         super().__init__(*args, **kwargs)
         self.viewChanged.connect(self._viewChangedHandler)
@@ -71,14 +79,53 @@ class FileViewer(ttk.TTkAbstractScrollView):
         self._indexing = None
         self.viewChanged.emit()
 
+    @ttk.pyTTkSlot(float)
+    def fileSearching(self, percentage):
+        self._searching = percentage
+        self.update()
+
+    @ttk.pyTTkSlot()
+    def fileSearched(self):
+        self._searching = None
+        self.update()
+
+    @ttk.pyTTkSlot()
+    def fileReloaded(self):
+        # The line numbers refer to a different content, drop them
+        self._selected = -1
+        self._selection = None
+        self._indexesMark = TloggHitSet()
+        self._rendered.clear()
+        self.searchedIndexes(TloggHitSet())
+
     def markIndexes(self, indexes):
         self._indexesMark = indexes
         self.viewChanged.emit()
 
+    @ttk.pyTTkSlot(int)
+    def toggleMark(self, line):
+        self._indexesMark.toggle(line)
+        self.viewChanged.emit()
+
     def searchedIndexes(self, indexes):
         self._indexesSearched = indexes
         self.viewChanged.emit()
 
+    def appendSearchedIndexes(self, indexes):
+        # The first new hit may be the last partial line already matched
+        self._indexesSearched.extend(indexes)
+        self.viewChanged.emit()
+
+    def discardSearchedIndex(self, line):
+        # The partial line matched before is not matching anymore
+        self._indexesSearched.discard(line)
+        self.viewChanged.emit()
+
+    def moveToEnd(self):
+        ox,_ = self.getViewOffsets()
+        _,h = self.viewFullAreaSize()
+        self.viewMoveTo(ox, max(0,h-self.height()))
+
     def searchRe(self, searchRe):
         self._searchRe = searchRe
         self.update()
@@ -106,10 +153,8 @@ class FileViewer(ttk.TTkAbstractScrollView):
         self._pressed = True
         if 0 <= index < self._fileBuffer.getLen():
             if x<3:
-                if index in self._indexesMark:
-                    self._indexesMark.pop(self._indexesMark.index(index))
-                else:
-                    self._indexesMark.append(index)
+                self.toggleMark(index)
+                self.markToggled.emit(index)
                 self.marked.emit(self._indexesMark)
             else:
                 self._selected = index
@@ -150,6 +195,13 @@ class FileViewer(ttk.TTkAbstractScrollView):
         self.viewMoveTo(ox, max(0,line-self.height()//2))
         self.update()
 
+    def selectTime(self, time) -> bool:
+        '''Select the first line with a timestamp >= time (see TloggTimeIndex), False if not available'''
+        if (line := self._fileBuffer.timeToLine(time)) is None:
+            return False
+        self.selectAndMove(max(0, min(line, self._fileBuffer.getIndexedLen()-1)))
+        return True
+
     def getLen(self):
         return self._fileBuffer.getLen()
 
@@ -159,54 +211,79 @@ class FileViewer(ttk.TTkAbstractScrollView):
     def getLineNum(self, num) -> int:
         return num
 
+    def _renderLine(self, text, lineNum, state, symbol, lenLineNumber):
+        '''Return the (color, prefix, line) of the row, the prefix is the symbol and the line number'''
+        line = ttk.TTkString(text.replace('\n','')).tab2spaces()
+        numberColor = ttk.TTkColor.bg("#444444")
+        symbolcolor = ttk.TTkColor.fg(('#0000ff','#ff0000','#00ffff')[symbol])
+        symbol = '○●❥'[symbol]
+
+        if state == 1:
+            selectedColor = ttk.TTkColor.bg("#008844")
+            searchedColor = ttk.TTkColor.fg("#FFFF00")+ttk.TTkColor.bg("#004400")
+            line = line.setColor(selectedColor)
+        elif state == 2:
+            selectedColor = ttk.TTkColor.bg("#008888")
+            searchedColor = ttk.TTkColor.fg("#FFFF00")+ttk.TTkColor.bg("#004400")
+            line = line.setColor(selectedColor)
+        else:
+            selectedColor = ttk.TTkColor.RST
+            searchedColor = ttk.TTkColor.fg("#000000")+ttk.TTkColor.bg("#AAAAAA")
+            # The first highlighter rule matching
+            if color := TloggHighlighter.match(line.toAscii()):
+                selectedColor = ttk.TTkColor.fg(color['fg'])+ttk.TTkColor.bg(color['bg'])
+                searchedColor = ttk.TTkColor.fg(color['bg'])+ttk.TTkColor.bg(color['fg'])
+                line = line.setColor(selectedColor)
+        if self._searchRe:
+            if m := line.findall(regexp=self._searchRe, ignoreCase=True):
+                for match in m:
+                    line = line.setColor(searchedColor, match=match)
+
+        # Add Line Number
+        lineNumber = ttk.TTkString() + numberColor + str(lineNum).rjust(lenLineNumber) + ttk.TTkColor.RST + ' '
+        prefix = ttk.TTkString() + symbolcolor + symbol + ttk.TTkColor.RST + ' ' + lineNumber
+        return selectedColor, prefix, line
+
     def paintEvent(self, canvas):
         ox,oy = self.getViewOffsets()
         bufferLen = self.getLen()
+        lenLineNumber = len(str(self.getLineNum(bufferLen-1)))
+        version = TloggHighlighter.version()
+        rendered = self._rendered
         for i in range(min(self.height(),bufferLen-oy)):
-            line = ttk.TTkString(self.getLine(i+oy).replace('\n','')).tab2spaces()
-            lineNum = self.getLineNum(i+oy)
+            row = i+oy
+            text = self.getLine(row)
+            lineNum = self.getLineNum(row)
             if lineNum in self._indexesMark:
-                symbolcolor = ttk.TTkColor.fg("#00ffff")
-                numberColor = ttk.TTkColor.bg("#444444")
-                symbol='❥'
+                symbol = 2
             elif lineNum in self._indexesSearched:
-                symbolcolor = ttk.TTkColor.fg("#ff0000")
-                numberColor = ttk.TTkColor.bg("#444444")
-                symbol='●'
+                symbol = 1
             else:
-                symbolcolor = ttk.TTkColor.fg("#0000ff")
-                numberColor = ttk.TTkColor.bg("#444444")
-                symbol='○'
-
-            if i+oy == self._selected:
-                selectedColor = ttk.TTkColor.bg("#008844")
-                searchedColor = ttk.TTkColor.fg("#FFFF00")+ttk.TTkColor.bg("#004400")
-                line = line.setColor(selectedColor)
-            elif self._selection and min(self._selection) <= i+oy <= max(self._selection):
-                selectedColor = ttk.TTkColor.bg("#008888")
-                searchedColor = ttk.TTkColor.fg("#FFFF00")+ttk.TTkColor.bg("#004400")
-                line = line.setColor(selectedColor)
+                symbol = 0
+            if row == self._selected:
+                state = 1
+            elif self._selection and min(self._selection) <= row <= max(self._selection):
+                state = 2
             else:
-                selectedColor = ttk.TTkColor.RST
-                searchedColor = ttk.TTkColor.fg("#000000")+ttk.TTkColor.bg("#AAAAAA")
-                # Check in the filters a matching color
-                for color in TloggCfg.colors:
-                    #TTkLog.debug(f"{color['pattern']} - {line}")
-                    if m := line.findall(regexp=color['pattern'], ignoreCase=color['ignorecase']):
-                        selectedColor = ttk.TTkColor.fg(color['fg'])+ttk.TTkColor.bg(color['bg'])
-                        searchedColor = ttk.TTkColor.fg(color['bg'])+ttk.TTkColor.bg(color['fg'])
-                        line = line.setColor(selectedColor)
-                        break
-            if self._searchRe:
-                if m := line.findall(regexp=self._searchRe, ignoreCase=True):
-                    for match in m:
-                        line = line.setColor(searchedColor, match=match)
-
-            # Add Line Number
-            lenLineNumber = len(str(self.getLineNum(bufferLen-1)))
-            lineNumber = ttk.TTkString() + numberColor + str(lineNum).rjust(lenLineNumber) + ttk.TTkColor.RST + ' '
-            # Compose print line
-            printLine = ttk.TTkString() + symbolcolor + symbol + ttk.TTkColor.RST + ' ' + lineNumber + line.substring(ox)
+                state = 0
+
+            # Everything the rendered line depends on, the line text included
+            # (the last partial line may grow, the file may be reloaded)
+            key = (text, version, self._searchRe, state, symbol, lenLineNumber)
+            if (entry := rendered.get(lineNum)) is not None and entry[0] == key:
+                rendered.move_to_end(lineNum)
+                _, selectedColor, prefix, line, lineOx, printLine = entry
+                if lineOx != ox:
+                    # Compose print line
+                    entry[4:] = ox, (printLine := prefix + line.substring(ox))
+            else:
+                selectedColor, prefix, line = self._renderLine(text, lineNum, state, symbol, lenLineNumber)
+                # Compose print line
+                printLine = prefix + line.substring(ox)
+                rendered[lineNum] = [key, selectedColor, prefix, line, ox, printLine]
+                rendered.move_to_end(lineNum)
+                while len(rendered) > max(self.height(), TloggCfg.options.get('renderCacheLines', 0x400)):
+                    rendered.popitem(last=False)
             # stupid scramble
             # printLine._text = ''.join([chr(121-(ord(l)-65)) if (65<=ord(l)<=121) else l for l in printLine._text])
             canvas.drawText(pos=(0,i), text=printLine, color=selectedColor, width=self.width(), )
@@ -214,17 +291,35 @@ class FileViewer(ttk.TTkAbstractScrollView):
         # Draw the loading banner
         if self._indexing is not None:
             canvas.drawText(pos=(0,0), text=f" [ Indexed: {int(100*self._indexing)}% ] ")
+        if self._searching is not None:
+            canvas.drawText(pos=(0,0 if self._indexing is None else 1),
+                            text=f" [ Searching: {int(100*self._searching)}% ] ")
 
 class FileViewerSearch(FileViewer):
-    __slots__ = ('_indexes')
+    __slots__ = ('_indexes', '_indexesWidth')
     def __init__(self, *args, **kwargs):
-        self._indexes = []
+        self._indexes = TloggHitSet()
+        self._indexesWidth = 0
         FileViewer.__init__(self, *args, **kwargs)
         self._name = kwargs.get('name' , 'FileViewerSearch' )
 
     def markIndexes(self, indexes):
         self._indexesMark = indexes
-        self._indexes = [i for i in sorted(set(self._indexesSearched+self._indexesMark))]
+        self._setIndexes(self._indexesSearched.union(self._indexesMark))
+        ox,oy = self.getViewOffsets()
+        self.viewMoveTo(ox,oy)
+        self.update()
+
+    @ttk.pyTTkSlot(int)
+    def toggleMark(self, line):
+        # Only the toggled line may be added/removed, the width is
+        # extended if needed (and kept if removed, it is an upper bound)
+        if self._indexesMark.toggle(line):
+            if line not in self._indexes:
+                self._indexes.add(line)
+                self._indexesWidth = max(self._indexesWidth, self._fileBuffer.getWidth([line]))
+        elif line not in self._indexesSearched:
+            self._indexes.discard(line)
         ox,oy = self.getViewOffsets()
         self.viewMoveTo(ox,oy)
         self.update()
@@ -237,30 +332,54 @@ class FileViewerSearch(FileViewer):
             lineSelected = self._indexes[self._selected]
 
         self._indexesSearched = indexes
-        self._indexes = [i for i in sorted(set(self._indexesSearched+self._indexesMark))]
+        self._setIndexes(self._indexesSearched.union(self._indexesMark))
         ox,_ = self.getViewOffsets()
 
         lineToMove = 0
-        if lineSelected > -1:
-            for i, lineNum in enumerate(self._indexes):
-                if lineNum >= lineSelected:
-                   if lineNum == lineSelected:
-                       self._selected = i
-                   else:
-                       self._selected = -1
-                   # Try to keep the  selected area at the center of the widget
-                   lineToMove = i if i <= self.height()/2 else int(i-self.height()/2)
-                   break
+        if lineSelected > -1 and (i := self._indexes.position(lineSelected)) < len(self._indexes):
+            if self._indexes[i] == lineSelected:
+                self._selected = i
+            else:
+                self._selected = -1
+            # Try to keep the  selected area at the center of the widget
+            lineToMove = i if i <= self.height()/2 else int(i-self.height()/2)
 
         self.viewMoveTo(ox, lineToMove)
         self.update()
 
+    def _setIndexes(self, indexes):
+        # The width is evaluated only when the lines change and not
+        # at every layout/scroll, it is cheap anyway (block max widths)
+        self._indexes = indexes
+        self._indexesWidth = self._fileBuffer.getWidth(indexes.lines())
+
+    def appendSearchedIndexes(self, indexes):
+        if not indexes: return
+        last = self._indexes[-1] if self._indexes else -1
+        self._indexesSearched.extend(indexes)
+        if indexes[0] < last:
+            # Not a tail (i.e. marked lines after the searched region)
+            self._setIndexes(self._indexesSearched.union(self._indexesMark))
+        else:
+            newLines = len(self._indexes)
+            self._indexes.extend(indexes)
+            # The previous last line may have grown (partial line)
+            self._indexesWidth = max(self._indexesWidth,
+                                     self._fileBuffer.getWidth(self._indexes[max(0,newLines-1):]))
+        self.viewChanged.emit()
+
+    def discardSearchedIndex(self, line):
+        self._indexesSearched.discard(line)
+        if line not in self._indexesMark:
+            self._indexes.discard(line)
+        self.viewChanged.emit()
+
     def viewFullAreaSize(self) -> (int, int):
         if self._indexes is None:
             w = 2+self._fileBuffer.getWidth()
             h = self._fileBuffer.getLen()
         else:
-            w = 2+self._fileBuffer.getWidth(self._indexes)
+            w = 2+self._indexesWidth
             h = len(self._indexes)
         return w , h
 
@@ -272,12 +391,9 @@ class FileViewerSearch(FileViewer):
         self._pressed = True
         if 0 <= index < len(self._indexes):
             if x<3:
-                index = self._indexes[oy+y]
-                if index in self._indexesMark:
-                    self._indexesMark.pop(self._indexesMark.index(index))
-                else:
-                    self._indexesMark.append(index)
-                self.markIndexes(self._indexesMark)
+                line = self._indexes[index]
+                self.toggleMark(line)
+                self.markToggled.emit(line)
                 self.marked.emit(self._indexesMark)
             else:
                 self._selected = index
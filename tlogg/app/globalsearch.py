@@ -0,0 +1,193 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['GlobalSearchView', 'GlobalSearchWindow']
+
+import os
+from bisect import bisect_right
+
+import TermTk as ttk
+
+from . import TloggCfg
+from .hitset     import TloggHitSet
+from .search     import TloggGlobalSearch
+from .fileviewer import FileViewerArea
+
+class GlobalSearchView(ttk.TTkAbstractScrollView):
+    '''
+    The hits of all the searched files merged in a single list,
+    grouped by file (in the tabs order) and labeled with the file name
+    '''
+    __slots__ = ('_results', '_offsets', '_selected', '_searchRe',
+                 # Signals
+                 'selected')
+    def __init__(self, *args, **kwargs):
+        # [(label, widget, fileBuffer, TloggHitSet)] and the first row of each one
+        self._results = []
+        self._offsets = [0]
+        self._selected = -1
+        self._searchRe = ""
+        # Signals
+        self.selected = ttk.pyTTkSignal(object, int)
+        super().__init__(*args, **kwargs)
+        self.viewChanged.connect(self.update)
+        self.setFocusPolicy(ttk.TTkK.ClickFocus)
+
+    def setSources(self, sources, searchRe):
+        '''"sources" is the list of (widget, fileBuffer) searched'''
+        self._results = [(os.path.basename(fb.filename()), w, fb, TloggHitSet()) for w,fb in sources]
+        self._offsets = [0]*(len(self._results)+1)
+        self._selected = -1
+        self._searchRe = searchRe
+        self.viewMoveTo(0, 0)
+        self.viewChanged.emit()
+
+    def appendHits(self, fileBuffer, indexes):
+        for pos,(_,_,fb,hits) in enumerate(self._results):
+            if fb is fileBuffer:
+                hits.extend(indexes)
+                break
+        offsets = [0]
+        for _,_,_,hits in self._results:
+            offsets.append(offsets[-1]+len(hits))
+        self._offsets = offsets
+        self.viewChanged.emit()
+
+    def hitCount(self) -> int:
+        return self._offsets[-1]
+
+    def sourceCount(self) -> int:
+        '''Return the number of files searched'''
+        return len(self._results)
+
+    def fileCount(self) -> int:
+        return sum(1 for _,_,_,hits in self._results if hits)
+
+    def _row(self, row):
+        '''Return the (label, widget, fileBuffer, line) displayed in the row'''
+        pos = bisect_right(self._offsets, row)-1
+        label, widget, fileBuffer, hits = self._results[pos]
+        return label, widget, fileBuffer, hits[row-self._offsets[pos]]
+
+    def viewFullAreaSize(self) -> (int, int):
+        w = max((len(label)+len(str(fb.getLen()))+2+fb.getWidth()
+                 for label,_,fb,_ in self._results), default=0)
+        return w, self._offsets[-1]
+
+    def viewDisplayedSize(self) -> (int, int):
+        return self.size()
+
+    def mousePressEvent(self, evt):
+        _,oy = self.getViewOffsets()
+        if 0 <= (row := oy+evt.y) < self._offsets[-1]:
+            self._selected = row
+            _, widget, _, line = self._row(row)
+            self.selected.emit(widget, line)
+            self.update()
+            return True
+        return super().mousePressEvent(evt)
+
+    def paintEvent(self, canvas):
+        ox,oy = self.getViewOffsets()
+        w = self.width()
+        labelColor  = ttk.TTkColor.fg("#00ffff")
+        numberColor = ttk.TTkColor.bg("#444444")
+        for y in range(min(self.height(), self._offsets[-1]-oy)):
+            label, _, fileBuffer, line = self._row(oy+y)
+            text = ttk.TTkString(fileBuffer.getLine(line).replace('\n','')).tab2spaces()
+            if oy+y == self._selected:
+                color = ttk.TTkColor.bg("#008844")
+                text = text.setColor(color)
+            else:
+                color = ttk.TTkColor.RST
+            if self._searchRe:
+                for match in text.findall(regexp=self._searchRe, ignoreCase=True):
+                    text = text.setColor(ttk.TTkColor.fg("#000000")+ttk.TTkColor.bg("#AAAAAA"), match=match)
+            lenLineNumber = len(str(fileBuffer.getLen()))
+            printLine = ( ttk.TTkString() + labelColor + label + ttk.TTkColor.RST + ':' +
+                          numberColor + str(line).rjust(lenLineNumber) + ttk.TTkColor.RST + ' ' +
+                          text )
+            canvas.drawText(pos=(0,y), text=printLine.substring(ox), color=color, width=w)
+
+class GlobalSearchWindow(ttk.TTkWindow):
+    '''
+    Search a regex in all the opened files at once,
+    "sources" returns the (widget, fileBuffer) of the opened files;
+    selecting a hit emits "selected" with its widget and line.
+    '''
+    __slots__ = ('_sources', '_view', '_searchbox', '_icase', '_status', '_worker',
+                 # Signals
+                 'selected')
+    def __init__(self, sources, *args, **kwargs):
+        ttk.TTkWindow.__init__(self, *args, **kwargs)
+        self._name = kwargs.get('name' , 'GlobalSearchWindow' )
+        self._sources = sources
+        self._worker = None
+
+        layout = ttk.TTkGridLayout()
+        self.setLayout(layout)
+        layout.addWidget(ttk.TTkLabel(text="Txt:", maxWidth=4), 0, 0)
+        layout.addWidget(searchbox := ttk.TTkComboBox(editable=True), 0, 1)
+        layout.addWidget(icase := ttk.TTkCheckbox(text="Aa", maxWidth=5, checked=True), 0, 2)
+        layout.addWidget(search := ttk.TTkButton(text="Search", maxWidth=10), 0, 3)
+        self._view = GlobalSearchView()
+        layout.addWidget(FileViewerArea(fileView=self._view), 1, 0, 1, 4)
+        layout.addWidget(status := ttk.TTkLabel(text=""), 2, 0, 1, 4)
+        searchbox.addItems(TloggCfg.searches)
+        self._searchbox = searchbox
+        self._icase = icase
+        self._status = status
+
+        # Signals
+        self.selected = self._view.selected
+
+        search.clicked.connect(self._search)
+        searchbox.editTextChanged.connect(self._search)
+        self.closed.connect(self._closed)
+
+    @ttk.pyTTkSlot()
+    def _closed(self):
+        if self._worker:
+            self._worker.cancel()
+
+    @ttk.pyTTkSlot()
+    def _search(self):
+        if self._worker:
+            self._worker.cancel()
+        regex = str(self._searchbox.currentText())
+        sources = self._sources()
+        self._view.setSources(sources, regex)
+        self._worker = worker = TloggGlobalSearch([fb for _,fb in sources], regex,
+                                                  self._icase.checkState() == ttk.TTkK.Checked)
+        worker.found.connect(self._view.appendHits)
+        worker.progress.connect(self._searching)
+        worker.finished.connect(self._searched)
+        self._searching(0.0)
+        worker.start()
+
+    @ttk.pyTTkSlot(float)
+    def _searching(self, progress):
+        self._status.setText(f"Searching {self._view.sourceCount()} files: {int(100*progress)}% - {self._view.hitCount()} hits")
+
+    @ttk.pyTTkSlot()
+    def _searched(self):
+        self._status.setText(f"{self._view.hitCount()} hits in {self._view.fileCount()} files")
@@ -0,0 +1,103 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggHighlighter']
+
+import re
+import threading
+
+from .cfg import TloggCfg
+from .prefilter import TloggPrefilter
+
+class TloggHighlighter():
+    '''
+    The highlighter rules (TloggCfg.colors) compiled once,
+    the first rule matching a line is the one used to color it.
+
+    Each rule keeps the literals required by any of its matches
+    (TloggPrefilter.requiredLiterals), the regex is evaluated only if
+    one of them is in the line (str.__contains__), most of the rules
+    are discarded without running the regex engine.
+
+    invalidate() (i.e. when the rules are saved) drops the compiled rules,
+    the version counter identifies the rules in use (i.e. for the caches).
+    '''
+    _mutex    = threading.Lock()
+    _version  = 0
+    _compiled = None
+    _rules    = None
+
+    @staticmethod
+    def version() -> int:
+        # Rules replaced without invalidate() bump the version
+        TloggHighlighter._segments()
+        return TloggHighlighter._version
+
+    @staticmethod
+    def invalidate():
+        with TloggHighlighter._mutex:
+            TloggHighlighter._version += 1
+            TloggHighlighter._compiled = None
+
+    @staticmethod
+    def _compile(rules) -> list:
+        '''Return the (regex, rule, literals, ignoreCase) in the rules order'''
+        ret = []
+        for rule in rules:
+            try:
+                rr = re.compile(rule['pattern'], re.IGNORECASE if rule['ignorecase'] else 0)
+            except re.error:
+                # Wrong patterns never match
+                continue
+            ignoreCase = bool(rr.flags & re.IGNORECASE)
+            literals = TloggPrefilter.requiredLiterals(rr)
+            if literals and ignoreCase:
+                # Some non ASCII chars match the ASCII ones ignoring the case
+                literals = [l.lower() for l in literals] if all(l.isascii() for l in literals) else None
+            ret.append((rr, rule, tuple(literals) if literals else None, ignoreCase))
+        return ret
+
+    @staticmethod
+    def _segments() -> list:
+        with TloggHighlighter._mutex:
+            # The rules may have been replaced without invalidate()
+            if TloggHighlighter._compiled is None or TloggHighlighter._rules is not TloggCfg.colors:
+                if TloggHighlighter._rules is not TloggCfg.colors:
+                    TloggHighlighter._version += 1
+                TloggHighlighter._rules = TloggCfg.colors
+                TloggHighlighter._compiled = TloggHighlighter._compile(TloggCfg.colors)
+            return TloggHighlighter._compiled
+
+    @staticmethod
+    def match(text):
+        '''Return the first rule (TloggCfg.colors item) matching the text, None if no one'''
+        lowered = text.lower() if text.isascii() else None
+        for rr, rule, literals, ignoreCase in TloggHighlighter._segments():
+            if literals:
+                if not ignoreCase:
+                    if not any(map(text.__contains__, literals)):
+                        continue
+                elif lowered is not None and not any(map(lowered.__contains__, literals)):
+                    continue
+            if rr.search(text):
+                return rule
+        return None
@@ -27,6 +27,7 @@ __all__ = ['highlightersFormLayout']
 import copy
 
 from . import TloggCfg, TloggGlbl
+from .highlighter import TloggHighlighter
 
 from TermTk import *
 
@@ -108,6 +109,7 @@ def highlightersFormLayout(win):
             colors.append(item.data())
         TloggCfg.colors = colors
         TloggCfg.save(searches=False, filters=False, colors=True, options=False)
+        TloggHighlighter.invalidate()
         TloggGlbl.refreshViews()
         # TTkHelper.updateAll()
 
@@ -0,0 +1,222 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggHitSet']
+
+from array import array
+from bisect import bisect_left
+
+class TloggHitSet():
+    '''
+    Sorted set of line numbers (search hits, marks)
+
+    The lines are stored in a sorted array, the position of a line is
+    found by bisection; the membership is tested on the bitmaps of the
+    blocks of 2^_shift lines, each built (once) only when the block is queried.
+
+    The set operations walk the sorted arrays chunk by chunk (at most _chunk
+    lines of each array, the same range of lines), the chunks where a side is
+    empty, disjoint or a contiguous range of lines are plain array slices,
+    the others are combined as (bounded) sets of lines.
+    '''
+    _shift = 16
+    _chunk = 0x10000
+    _mask  = (1 << _shift) - 1
+    _empty = bytes(1 << (_shift-3))
+
+    __slots__ = ('_lines', '_bitmaps')
+    def __init__(self, lines=()):
+        '''"lines" must be sorted and without duplicates, see fromLines()'''
+        self._lines = array('Q', lines)
+        self._bitmaps = {}
+
+    @staticmethod
+    def fromLines(lines):
+        return TloggHitSet(sorted(set(lines)))
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __iter__(self):
+        return iter(self._lines)
+
+    def __getitem__(self, pos):
+        return self._lines[pos]
+
+    def __contains__(self, line) -> bool:
+        if not self._lines or not 0 <= line <= self._lines[-1]:
+            return False
+        bit = line & self._mask
+        return bool(self._bitmap(line >> self._shift)[bit >> 3] & (1 << (bit & 7)))
+
+    def _bitmap(self, block):
+        if (bitmap := self._bitmaps.get(block)) is None:
+            lines = self._lines
+            base = block << self._shift
+            hits = lines[bisect_left(lines, base):bisect_left(lines, base + self._mask + 1)]
+            if not hits:
+                bitmap = self._empty
+            else:
+                bitmap = bytearray(self._empty)
+                for bit in hits:
+                    bit -= base
+                    bitmap[bit >> 3] |= 1 << (bit & 7)
+            self._bitmaps[block] = bitmap
+        return bitmap
+
+    def _invalidate(self, first, last):
+        # Drop the bitmaps of the blocks in the [first,last] lines,
+        # always after the lines are changed, a bitmap built in the
+        # meantime is built again
+        for block in range(first >> self._shift, (last >> self._shift) + 1):
+            self._bitmaps.pop(block, None)
+
+    def lines(self) -> array:
+        '''Return the sorted array of lines, not to be modified'''
+        return self._lines
+
+    def tolist(self) -> list:
+        return self._lines.tolist()
+
+    def position(self, line) -> int:
+        '''Return the position of the first line >= "line"'''
+        return bisect_left(self._lines, line)
+
+    def add(self, line):
+        pos = bisect_left(self._lines, line)
+        if pos == len(self._lines) or self._lines[pos] != line:
+            self._lines.insert(pos, line)
+            self._invalidate(line, line)
+
+    def discard(self, line):
+        pos = bisect_left(self._lines, line)
+        if pos < len(self._lines) and self._lines[pos] == line:
+            del self._lines[pos]
+            self._invalidate(line, line)
+
+    def toggle(self, line) -> bool:
+        '''Add or remove the line, return True if added'''
+        if line in self:
+            self.discard(line)
+            return False
+        self.add(line)
+        return True
+
+    def extend(self, lines):
+        '''Add the sorted "lines", appended if those follow the last one'''
+        if not len(lines): return
+        last = self._lines[-1] if self._lines else -1
+        # The first line may be the last one (i.e. a partial line searched again)
+        pos = 1 if lines[0] == last else 0
+        if pos < len(lines) and lines[pos] > last:
+            self._lines.extend(lines[pos:])
+            self._invalidate(lines[pos], lines[-1])
+        elif pos < len(lines):
+            self._lines = TloggHitSet._merge(self._lines, array('Q', lines[pos:]))
+            self._bitmaps = {}
+
+    def union(self, other):
+        '''Return a new set with the lines of both'''
+        small, large = sorted((self._lines, other.lines()), key=len)
+        ret = TloggHitSet(large)
+        if len(small) < 0x100:
+            for line in small:
+                ret.add(line)
+        else:
+            ret._lines = TloggHitSet._merge(large, small)
+        return ret
+
+    def intersection(self, other):
+        '''Return a new set with the lines in both'''
+        ret = array('Q')
+        for a, b in TloggHitSet._chunks(self._lines, other.lines()):
+            if not a or not b or a[-1] < b[0] or b[-1] < a[0]:
+                continue
+            if b[-1]-b[0]+1 == len(b):
+                ret.extend(a[bisect_left(a, b[0]):bisect_left(a, b[-1]+1)])
+            elif a[-1]-a[0]+1 == len(a):
+                ret.extend(b[bisect_left(b, a[0]):bisect_left(b, a[-1]+1)])
+            else:
+                common = set(a.tolist())
+                common.intersection_update(b.tolist())
+                ret.extend(sorted(common))
+        return TloggHitSet(ret)
+
+    def difference(self, other):
+        '''Return a new set with the lines not in "other"'''
+        ret = array('Q')
+        for a, b in TloggHitSet._chunks(self._lines, other.lines()):
+            if not a:
+                continue
+            if not b or a[-1] < b[0] or b[-1] < a[0]:
+                ret.extend(a)
+            elif b[-1]-b[0]+1 == len(b):
+                ret.extend(a[:bisect_left(a, b[0])])
+                ret.extend(a[bisect_left(a, b[-1]+1):])
+            else:
+                left = set(a.tolist())
+                left.difference_update(b.tolist())
+                ret.extend(sorted(left))
+        return TloggHitSet(ret)
+
+    @staticmethod
+    def unionAll(sets):
+        '''Return a new set with the lines of all the sets'''
+        runs = [s.lines() for s in sets]
+        if not runs:
+            return TloggHitSet()
+        # Merged in pairs, each line is merged log2(len(sets)) times
+        while len(runs) > 1:
+            runs = [TloggHitSet._merge(*runs[i:i+2]) if i+1 < len(runs) else runs[i]
+                    for i in range(0, len(runs), 2)]
+        return TloggHitSet(runs[0])
+
+    @staticmethod
+    def _chunks(a, b):
+        '''Yield the slices of the sorted arrays "a" and "b" in the same ranges of lines'''
+        n = TloggHitSet._chunk
+        posA = posB = 0
+        while posA < len(a) or posB < len(b):
+            if limits := [s[p+n] for s, p in ((a, posA), (b, posB)) if p+n < len(s)]:
+                limit = min(limits)
+                endA, endB = bisect_left(a, limit, posA), bisect_left(b, limit, posB)
+            else:
+                endA, endB = len(a), len(b)
+            yield a[posA:endA], b[posB:endB]
+            posA, posB = endA, endB
+
+    @staticmethod
+    def _merge(a, b) -> array:
+        '''Return the sorted array with the lines of the sorted arrays "a" and "b"'''
+        ret = array('Q')
+        for a, b in TloggHitSet._chunks(a, b):
+            if not b or (a and a[-1] < b[0]):
+                ret.extend(a)
+                ret.extend(b)
+            elif not a or b[-1] < a[0]:
+                ret.extend(b)
+                ret.extend(a)
+            else:
+                both = set(a.tolist())
+                both.update(b.tolist())
+                ret.extend(sorted(both))
+        return ret
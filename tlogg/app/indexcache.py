@@ -0,0 +1,138 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggIndexCache']
+
+import os
+import json
+import zlib
+import hashlib
+from .cfg import TloggCfg
+from .lineindex import TloggLineIndex
+
+'''
+    Sidecar file layout (stored in <pathCfg>/index/<sha1(abspath)>.idx)
+
+    | MAGIC | header len (8 bytes LE) | json header | TloggLineIndex |
+
+    The header contains the identity of the indexed file:
+        path, inode, size, mtime, head checksum, tail checksum
+    where the tail checksum covers the bytes right before the indexed size,
+    this allows to detect a file that has only been appended
+'''
+class TloggIndexCache():
+    _magic   = b'TLOGGIDX'
+    _version = 4
+    _sample  = 0x10000 # 64K used for the head/tail checksums
+    _minSize = 0x100000 # Don't bother caching files smaller than 1M
+
+    @staticmethod
+    def enabled() -> bool:
+        return TloggCfg.options.get('indexCache', True)
+
+    @staticmethod
+    def _cachePath(filename, ext='idx') -> str:
+        key = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()
+        return os.path.join(TloggCfg.pathCfg, 'index', f"{key}.{ext}")
+
+    @staticmethod
+    def _checksum(fd, start, end) -> int:
+        start = max(0,start)
+        fd.seek(start)
+        return zlib.crc32(fd.read(max(0,end-start)))
+
+    @staticmethod
+    def _fileInfo(fd, filename, size) -> dict:
+        stat = os.stat(filename)
+        sample = TloggIndexCache._sample
+        return {
+            'version' : TloggIndexCache._version,
+            'path'  : os.path.abspath(filename),
+            'inode' : stat.st_ino,
+            'size'  : size,
+            'mtime' : stat.st_mtime_ns,
+            'head'  : TloggIndexCache._checksum(fd, 0, min(size,sample)),
+            'tail'  : TloggIndexCache._checksum(fd, size-sample, size)}
+
+    @staticmethod
+    def load(filename):
+        '''
+        Return the cached (offsets, indexedSize) or None
+
+        The offsets are valid up to indexedSize, if the file grew since it was
+        cached, only the region after indexedSize need to be indexed.
+        '''
+        if not TloggIndexCache.enabled(): return None
+        cachePath = TloggIndexCache._cachePath(filename)
+        if not os.path.isfile(cachePath): return None
+        try:
+            with open(cachePath, 'rb') as f:
+                if f.read(len(TloggIndexCache._magic)) != TloggIndexCache._magic:
+                    return None
+                headerLen = int.from_bytes(f.read(8), 'little')
+                header = json.loads(f.read(headerLen))
+                if header.get('version') != TloggIndexCache._version:
+                    return None
+                if not TloggIndexCache._matches(header, filename):
+                    return None
+                return TloggLineIndex.fromfile(f), header['size']
+        except (OSError, ValueError, KeyError, EOFError):
+            return None
+
+    @staticmethod
+    def _matches(header, filename) -> bool:
+        '''
+        Return True if the file described by the header is still the same,
+        or it has been only appended since
+        '''
+        stat = os.stat(filename)
+        size = header['size']
+        if ( header['path']  != os.path.abspath(filename) or
+             header['inode'] != stat.st_ino or
+             stat.st_size < size or
+             ( stat.st_size == size and header['mtime'] != stat.st_mtime_ns ) ):
+            return False
+        with open(filename, 'rb') as fd:
+            info = TloggIndexCache._fileInfo(fd, filename, size)
+        return info['head'] == header['head'] and info['tail'] == header['tail']
+
+    @staticmethod
+    def save(filename, offsets:TloggLineIndex, size):
+        if not TloggIndexCache.enabled(): return
+        if size < TloggIndexCache._minSize: return
+        cachePath = TloggIndexCache._cachePath(filename)
+        try:
+            os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+            with open(filename, 'rb') as fd:
+                header = TloggIndexCache._fileInfo(fd, filename, size)
+            header = json.dumps(header).encode()
+            # Write to a temp file and move it to avoid partial sidecars
+            # if two instances are indexing the same file
+            tmpPath = f"{cachePath}.{os.getpid()}.tmp"
+            with open(tmpPath, 'wb') as f:
+                f.write(TloggIndexCache._magic)
+                f.write(len(header).to_bytes(8, 'little'))
+                f.write(header)
+                offsets.tofile(f)
+            os.replace(tmpPath, cachePath)
+        except OSError:
+            pass
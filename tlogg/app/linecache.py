@@ -0,0 +1,107 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggLineCache']
+
+import sys
+import threading
+from itertools import count
+from collections import OrderedDict
+
+from .cfg import TloggCfg
+
+class TloggLineCache():
+    '''
+    Decoded lines cache shared by all the opened files
+
+    A single LRU bounded by options['cacheSize'] (bytes, default 64M);
+    the entries are keyed by (owner, key) where owner identifies the
+    file buffer and key is a page of lines or a single line.
+    '''
+    _entries  = OrderedDict()
+    _sizes    = {}
+    _mutex    = threading.Lock()
+    _owners   = count(1)
+    _resident = 0
+    _hits      = 0
+    _misses    = 0
+    _evictions = 0
+
+    @staticmethod
+    def budget() -> int:
+        return TloggCfg.options.get('cacheSize', 0x4000000)
+
+    @staticmethod
+    def newOwner() -> int:
+        return next(TloggLineCache._owners)
+
+    @staticmethod
+    def get(owner, key):
+        with TloggLineCache._mutex:
+            if (entry := TloggLineCache._entries.get((owner,key))) is None:
+                TloggLineCache._misses += 1
+                return None
+            TloggLineCache._hits += 1
+            TloggLineCache._entries.move_to_end((owner,key))
+            return entry
+
+    @staticmethod
+    def put(owner, key, entry):
+        if isinstance(entry, str):
+            size = sys.getsizeof(entry)
+        else:
+            size = sys.getsizeof(entry) + sum(map(sys.getsizeof, entry))
+        with TloggLineCache._mutex:
+            TloggLineCache._remove((owner,key))
+            TloggLineCache._entries[(owner,key)] = entry
+            TloggLineCache._sizes[(owner,key)] = size
+            TloggLineCache._resident += size
+            budget = TloggLineCache.budget()
+            while TloggLineCache._resident > budget and len(TloggLineCache._entries) > 1:
+                oldest,_ = TloggLineCache._entries.popitem(last=False)
+                TloggLineCache._resident -= TloggLineCache._sizes.pop(oldest)
+                TloggLineCache._evictions += 1
+
+    @staticmethod
+    def _remove(k):
+        if TloggLineCache._entries.pop(k, None) is not None:
+            TloggLineCache._resident -= TloggLineCache._sizes.pop(k)
+
+    @staticmethod
+    def invalidate(owner, key=None):
+        '''Drop one entry or, if key is None, all the entries of the owner'''
+        with TloggLineCache._mutex:
+            if key is not None:
+                TloggLineCache._remove((owner,key))
+            else:
+                for k in [k for k in TloggLineCache._entries if k[0]==owner]:
+                    TloggLineCache._remove(k)
+
+    @staticmethod
+    def stats() -> dict:
+        return {
+            'hits'      : TloggLineCache._hits,
+            'misses'    : TloggLineCache._misses,
+            'evictions' : TloggLineCache._evictions,
+            'entries'   : len(TloggLineCache._entries),
+            'resident'  : TloggLineCache._resident,
+            'budget'    : TloggLineCache.budget()}
@@ -0,0 +1,233 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggLineIndex', 'TloggSparseIndex']
+
+from array import array
+from bisect import bisect_left
+from operator import sub
+from itertools import chain, repeat
+
+'''
+    Line offsets stored as blocks of 32bit deltas with 64bit absolute checkpoints
+
+    Checkpoints | C0                | C1                | C2 ...
+    Deltas      | 0 | d1 | d2 | ... | 0 | d1 | d2 | ... | 0 ...
+                  <--- _block ----->
+
+    offset(line) = checkpoints[line // _block] + deltas[line]
+
+    ~4 bytes per line (+8 bytes every _block lines) instead of
+    the ~36 bytes required by a python int stored in a list.
+    If a block span more than 4G (absurdly long lines) the index
+    fallback to plain 64bit absolute offsets.
+
+    The line widths (bytes) are derived from the offsets,
+    for each block the width of the widest line is tracked (_blockMax)
+    to get an upper bound of the max width of any set of lines
+    without reading the file.
+'''
+class TloggLineIndex():
+    _block = 0x400
+    _shift = 10
+    _deltaMax = 0xFFFFFFFF
+    _widthMax = 0xFFFFFFFF
+    __slots__ = ('_checkpoints', '_deltas', '_wide',
+                 '_blockMax', '_maxWidth')
+    def __init__(self, offsets=None):
+        self._checkpoints = array('Q')
+        self._deltas      = array('I')
+        self._wide        = None
+        self._blockMax    = array('I')
+        self._maxWidth    = 0
+        if offsets is not None:
+            self.extend(offsets)
+
+    def __len__(self):
+        if self._wide is not None:
+            return len(self._wide)
+        return len(self._deltas)
+
+    def __getitem__(self, line):
+        if self._wide is not None:
+            return self._wide[line]
+        if line < 0:
+            line += len(self._deltas)
+        return self._checkpoints[line>>self._shift] + self._deltas[line]
+
+    def _widen(self):
+        self._wide = array('Q', (self[i] for i in range(len(self._deltas))))
+        self._checkpoints = array('Q')
+        self._deltas      = array('I')
+
+    def append(self, offset):
+        self.extend((offset,))
+
+    def _updateWidths(self, first, offsets):
+        # offsets[0] is the end of the line (first-1)
+        if first:
+            prev = self[first-1]
+        elif len(offsets) > 1:
+            prev, first, offsets = offsets[0], 1, offsets[1:]
+        else:
+            return
+        widths = array('I', map(min, map(sub, offsets, chain((prev,),offsets)), repeat(self._widthMax)))
+        mask = self._block-1
+        line = first-1
+        pos = 0
+        while pos < len(widths):
+            block = line >> self._shift
+            end = pos + self._block - (line & mask)
+            segment = widths[pos:end]
+            if len(self._blockMax) <= block:
+                self._blockMax.append(0)
+            self._blockMax[block] = max(self._blockMax[block], max(segment))
+            line += len(segment)
+            pos = end
+        self._maxWidth = max(self._maxWidth, max(widths))
+
+    def extend(self, offsets):
+        if not (isinstance(offsets, array) and offsets.typecode == 'Q'):
+            offsets = array('Q',offsets)
+        if not offsets: return
+        self._updateWidths(len(self), offsets)
+        if self._wide is not None:
+            return self._wide.extend(offsets)
+        offsets = memoryview(offsets)
+        deltas = self._deltas
+        checkpoints = self._checkpoints
+        pos = 0
+        while pos < len(offsets):
+            # Fill the current block (or start a new one)
+            if not (n:=len(deltas)) & (self._block-1):
+                checkpoints.append(offsets[pos])
+            checkpoint = checkpoints[-1]
+            end = pos + self._block - (n & (self._block-1))
+            segment = offsets[pos:end]
+            if segment[-1] - checkpoint > self._deltaMax:
+                self._widen()
+                return self._wide.extend(offsets[pos:])
+            deltas.extend(map(sub, segment, repeat(checkpoint)))
+            pos = end
+
+    def width(self, line) -> int:
+        '''The size in bytes of the line (0 for the last one that has no end yet)'''
+        if not 0 <= line < len(self)-1: return 0
+        return self[line+1]-self[line]
+
+    def maxWidth(self, lines=None) -> int:
+        '''
+        Return the widest line in the whole index or an upper bound of the
+        widest in the sorted "lines", the widest line of each block containing
+        any of them (exact if it is one of the lines), one bisect per block
+        '''
+        if lines is None:
+            return self._maxWidth
+        ret = 0
+        pos = 0
+        numLines = len(lines)
+        blockMax = self._blockMax
+        while pos < numLines:
+            block = lines[pos] >> self._shift
+            if block >= len(blockMax): break
+            ret = max(ret, blockMax[block])
+            pos = bisect_left(lines, (block+1) << self._shift, pos)
+        return ret
+
+    def memoryUsage(self) -> int:
+        if self._wide is not None:
+            return self._wide.itemsize*len(self._wide)
+        return ( self._checkpoints.itemsize*len(self._checkpoints) +
+                 self._deltas.itemsize*len(self._deltas) )
+
+    def bytesPerLine(self) -> float:
+        if not (lines:=len(self)): return 0.0
+        return self.memoryUsage()/lines
+
+    def tofile(self, f):
+        wide = self._wide is not None
+        f.write(int(wide).to_bytes(1, 'little'))
+        if wide:
+            f.write(len(self._wide).to_bytes(8, 'little'))
+            self._wide.tofile(f)
+        else:
+            f.write(len(self._checkpoints).to_bytes(8, 'little'))
+            f.write(len(self._deltas).to_bytes(8, 'little'))
+            self._checkpoints.tofile(f)
+            self._deltas.tofile(f)
+        f.write(len(self._blockMax).to_bytes(8, 'little'))
+        self._blockMax.tofile(f)
+
+    @staticmethod
+    def fromfile(f):
+        ret = TloggLineIndex()
+        if int.from_bytes(f.read(1), 'little'):
+            ret._wide = array('Q')
+            ret._wide.fromfile(f, int.from_bytes(f.read(8), 'little'))
+        else:
+            numCheckpoints = int.from_bytes(f.read(8), 'little')
+            numDeltas      = int.from_bytes(f.read(8), 'little')
+            ret._checkpoints.fromfile(f, numCheckpoints)
+            ret._deltas.fromfile(f, numDeltas)
+        numBlocks = int.from_bytes(f.read(8), 'little')
+        ret._blockMax.fromfile(f, numBlocks)
+        ret._maxWidth = max(ret._blockMax, default=0)
+        return ret
+
+class TloggSparseIndex():
+    '''
+    Approximate index used while the full index is being built
+
+        File  |=====indexed=====|.......gap.......|===tail===|
+        Lines | exact           | estimated       | exact from the end
+
+    The average line length is sampled from the head and the tail,
+    the lines in the gap are found seeking to the estimated byte position
+    and resyncing on the next newline.
+    '''
+    _sample = 0x100000 # 1M
+    __slots__ = ('_avg', '_tail', '_tailStart')
+    def __init__(self, head:bytes, tail:array, tailStart:int, tailSize:int):
+        # tail contains the line starts found in the last tailSize bytes
+        lines = max(1, head.count(b'\n') + len(tail))
+        self._avg = max(1.0, (len(head)+tailSize)/lines)
+        self._tail = tail
+        self._tailStart = tailStart
+
+    def active(self, indexedBytes) -> bool:
+        return indexedBytes < self._tailStart
+
+    def estimate(self, indexedLines, indexedBytes) -> int:
+        '''The estimated number of lines'''
+        gap = max(0, self._tailStart - indexedBytes)
+        return indexedLines + int(gap/self._avg) + len(self._tail)
+
+    def offset(self, line, indexedLines, indexedBytes):
+        '''
+        Return (offset, exact), if not exact the offset is an estimation
+        inside the gap and require a resync on the next newline
+        '''
+        length = self.estimate(indexedLines, indexedBytes)
+        if (tailLine := line - (length-len(self._tail))) >= 0:
+            return self._tail[tailLine], True
+        pos = indexedBytes + int((line-indexedLines)*self._avg)
+        return min(pos, self._tailStart-1), False
@@ -22,21 +22,77 @@
 
 __all__ = ['LoggWidget']
 
+import re
+import threading
+from bisect import bisect_left
+
 import TermTk as ttk
 
 from .cfg  import TloggCfg
 from .glbl import TloggGlbl
 from .fileviewer  import FileViewer, FileViewerArea, FileViewerSearch
+from .minimap     import FileViewerMinimap
+from .filebuffer  import TloggFileBuffer
+from .search      import TloggSearch, TloggFiltersSearch, TloggQuerySearch
+from .query       import TloggQuery
+from .hitset      import TloggHitSet
 from .predefinedfilters import PredefinedFilters
 
+_reSpecial = set('.^$*+?{}[]\\|()')
+
+def _narrows(prevText, prevICase, text, ignoreCase) -> bool:
+    '''
+    Return True if every line matching "text" matches also "prevText",
+    (both literals and the previous one is contained in the new one)
+    '''
+    if _reSpecial.intersection(prevText) or _reSpecial.intersection(text):
+        return False
+    if prevICase:
+        return prevText.isascii() and text.isascii() and prevText.lower() in text.lower()
+    return not ignoreCase and prevText in text
+
+# Global inline flags and back references (the group numbers are shifted)
+# change the meaning of a pattern joined to the others
+_reNotJoinable = re.compile(r'\(\?[aiLmsux]+\)|\\[1-9]|\(\?P=')
+
+def _filters(text, patterns) -> list:
+    '''
+    Return the patterns (i.e. the predefined filters) joined by "|" in
+    "text", the lines matching "text" are the ones matching any of them;
+    None if "text" is not such a composition of at least two patterns.
+    '''
+    def _valid(p):
+        if not p or _reNotJoinable.search(p): return False
+        try:
+            re.compile(p)
+        except re.error:
+            return False
+        return True
+    patterns = [p for p in dict.fromkeys(patterns) if _valid(p)]
+    def _split(pos):
+        for p in patterns:
+            end = pos+len(p)
+            if not text.startswith(p, pos): continue
+            if end == len(text):
+                return [p]
+            if text[end] == '|' and (ret := _split(end+1)):
+                return [p] + ret
+        return None
+    if (ret := _split(0)) and len(ret) > 1:
+        return ret
+    return None
+
 class LoggWidget(ttk.TTkSplitter):
-    __slots__ = ('_btn_filters', '_bls_label_1', '_bls_cb_icase', '_bls_search', '_bls_searchbox',
-                 '_topViewport', '_bottomViewport',
-                 '_fileBuffer')
+    __slots__ = ('_btn_filters', '_bls_label_1', '_bls_cb_icase', '_bls_cb_query', '_bls_search', '_bls_searchbox',
+                 '_bls_cb_follow', '_bls_cb_scroll', '_bls_time', '_followTimer',
+                 '_topViewport', '_bottomViewport', '_minimap',
+                 '_fileBuffer', '_searchedText', '_searchedICase', '_searchedQuery', '_searchWorker',
+                 '_searchTimer', '_searchedHits', '_searchDone', '_hitsMutex', '_appendedHits',
+                 '_timeWindow', '_filtersOverlay')
     def __init__(self, filename, *args, **kwargs):
         super().__init__(*args, **kwargs|{'orientation':ttk.TTkK.VERTICAL})
 
-        topFrame    = ttk.TTkFrame(parent=self, border=False, layout=ttk.TTkVBoxLayout())
+        topFrame    = ttk.TTkFrame(parent=self, border=False, layout=ttk.TTkHBoxLayout())
         bottomFrame = ttk.TTkFrame(parent=self, border=False, layout=ttk.TTkVBoxLayout())
 
 
@@ -45,53 +101,345 @@ class LoggWidget(ttk.TTkSplitter):
         self._btn_filters   = ttk.TTkButton(text="Filters ^", maxWidth=11)
         self._bls_label_1   = ttk.TTkLabel(text=" Txt:", maxWidth=5)
         self._bls_cb_icase  = ttk.TTkCheckbox(text="Aa", maxWidth=5, checked=True)
+        self._bls_cb_query  = ttk.TTkCheckbox(text="Qry", maxWidth=6, checked=False)
         self._bls_search    = ttk.TTkButton(text="Search", maxWidth=10)
         self._bls_searchbox = ttk.TTkComboBox(editable=True)
         self._bls_searchbox.addItems(TloggCfg.searches)
         self._bls_searchbox.setCurrentIndex(0)
+        self._bls_cb_follow = ttk.TTkCheckbox(text="Follow", maxWidth=9, checked=False)
+        self._bls_cb_scroll = ttk.TTkCheckbox(text="Scroll", maxWidth=9, checked=True)
+        self._bls_time      = ttk.TTkLineEdit(maxWidth=14,
+                                  toolTip="Jump to a time (14:32)\nor search only a time window (14:30..14:45)")
 
         bottomLayoutSearch.addWidget(self._btn_filters)
         bottomLayoutSearch.addWidget(self._bls_label_1)
         bottomLayoutSearch.addWidget(self._bls_searchbox)
         bottomLayoutSearch.addWidget(self._bls_cb_icase)
+        bottomLayoutSearch.addWidget(self._bls_cb_query)
         bottomLayoutSearch.addWidget(self._bls_search)
+        bottomLayoutSearch.addWidget(ttk.TTkLabel(text=" Time:", maxWidth=6))
+        bottomLayoutSearch.addWidget(self._bls_time)
+        bottomLayoutSearch.addWidget(self._bls_cb_follow)
+        bottomLayoutSearch.addWidget(self._bls_cb_scroll)
 
         bottomFrame.layout().addItem(bottomLayoutSearch)
 
         # Define the main file Viewer
-        self._fileBuffer = ttk.TTkFileBuffer(filename, 0x100, 0x1000)
+        self._fileBuffer = TloggFileBuffer(filename)
         self._topViewport = FileViewer(filebuffer=self._fileBuffer)
         topViewer = FileViewerArea(parent=topFrame, fileView=self._topViewport)
+        # The density of the hits/marks/highlighted lines beside the viewer
+        self._minimap = FileViewerMinimap(parent=topFrame, filebuffer=self._fileBuffer, fileView=self._topViewport)
+        self._minimap.selected.connect(self._topViewport.selectAndMove)
+        self._fileBuffer.appended.connect(self._minimap.fileAppended)
         self._fileBuffer.indexUpdated.connect(self._topViewport.fileIndexing)
         self._fileBuffer.indexed.connect(self._topViewport.fileIndexed)
+        self._fileBuffer.appended.connect(self._appended)
+        self._fileBuffer.reloaded.connect(self._reloaded)
         # Define the Search Viewer
         self._bottomViewport = FileViewerSearch(filebuffer=self._fileBuffer)
         bottomViewer = FileViewerArea(parent=bottomFrame, fileView=self._bottomViewport)
         self._bottomViewport.selected.connect(self._topViewport.selectAndMove)
-        self._bottomViewport.marked.connect(self._topViewport.markIndexes)
-        self._topViewport.marked.connect(self._bottomViewport.markIndexes)
+        self._bottomViewport.markToggled.connect(self._topViewport.toggleMark)
+        self._topViewport.markToggled.connect(self._bottomViewport.toggleMark)
+        self._bottomViewport.marked.connect(self._minimap.markIndexes)
+        self._topViewport.marked.connect(self._minimap.markIndexes)
 
         # Add those viewpoers to the global list to allow dynamic refresh
         # TODO: Try to get rid of this
         TloggGlbl.addRefView(self._topViewport)
         TloggGlbl.addRefView(self._bottomViewport)
 
+        # Enter or the search button store the text in the history,
+        # the typed text is searched when the typing pauses and a
+        # text selected from the history immediately (likely cached)
         self._bls_search.clicked.connect(self._search)
         self._bls_searchbox.editTextChanged.connect(self._search)
+        self._bls_searchbox.lineEdit().textChanged.connect(self._searchTextChanged)
+        # Deleting (backspace, delete, cut) emits only textEdited
+        self._bls_searchbox.lineEdit().textEdited.connect(self._searchTextChanged)
+        self._bls_searchbox.currentIndexChanged.connect(self._searchSelected)
 
+        # The typed text is searched only when the typing pauses
+        self._searchTimer = ttk.TTkTimer()
+        self._searchTimer.timeout.connect(self._searchTyped)
+        self._searchedText  = ""
+        self._searchedICase = True
+        # The boolean query (Qry), the search text is a regex if None
+        self._searchedQuery = None
+        self._searchWorker  = None
+        # The hits of the last search, reused to narrow the next one
+        self._searchedHits  = TloggHitSet()
+        self._searchDone    = False
+        # The hits are updated by the search worker and by the follow timer,
+        # the (oldLen, hits) of the lines appended while searching are
+        # merged once the search is finished
+        self._hitsMutex     = threading.Lock()
+        self._appendedHits  = []
+        # The (from, to) times searched, see TloggTimeIndex
+        self._timeWindow    = None
+        self._bls_time.returnPressed.connect(self._timeEntered)
+
+        # Poll the file for rotation/truncation and,
+        # in follow mode, for appended data
+        self._followTimer = ttk.TTkTimer()
+        self._followTimer.timeout.connect(self._poll)
+        self._bls_cb_follow.stateChanged.connect(self._followToggled)
+        self._followTimer.start(TloggCfg.options.get('followInterval', 1.0))
+
+        # The filters overlay, its count is stopped when replaced
+        self._filtersOverlay = None
         def _openPredefinedFilters():
-            ttk.TTkHelper.overlay(self._btn_filters, PredefinedFilters(self._bls_searchbox), -2, 1)
+            if self._filtersOverlay is not None:
+                self._filtersOverlay.cancel()
+            self._filtersOverlay = PredefinedFilters(self._bls_searchbox, self._fileBuffer,
+                                                     self._bls_cb_icase.checkState() == ttk.TTkK.Checked)
+            ttk.TTkHelper.overlay(self._btn_filters, self._filtersOverlay, -2, 1)
         self._btn_filters.clicked.connect(_openPredefinedFilters)
 
+    def fileBuffer(self) -> TloggFileBuffer:
+        return self._fileBuffer
+
+    def selectLine(self, line):
+        '''Select and show the line in the file viewer'''
+        self._topViewport.selectAndMove(line)
+
+    def closeFile(self):
+        '''Stop the running search and the file polling, the tab has been closed'''
+        if self._searchWorker:
+            self._searchWorker.cancel()
+        self._minimap.cancel()
+        if self._filtersOverlay is not None:
+            self._filtersOverlay.cancel()
+        self._searchTimer.quit()
+        self._followTimer.quit()
+
+    @ttk.pyTTkSlot(ttk.TTkK.CheckState)
+    def _followToggled(self, state):
+        if state == ttk.TTkK.Checked:
+            self._followTimer.stop()
+            self._poll()
+
     @ttk.pyTTkSlot()
-    def _search(self):
+    def _poll(self):
+        try:
+            self._fileBuffer.refresh(follow=self._bls_cb_follow.checkState() == ttk.TTkK.Checked)
+        finally:
+            # Keep polling (follow and rotation/truncation) whatever happens
+            self._followTimer.start(TloggCfg.options.get('followInterval', 1.0))
+
+    @ttk.pyTTkSlot()
+    def _reloaded(self):
+        # The file has been rotated or truncated, marks and
+        # search results refer to the old content
+        self._topViewport.fileReloaded()
+        self._bottomViewport.fileReloaded()
+        self._minimap.fileReloaded()
+        if self._searchedText:
+            self._startSearch()
+
+    @ttk.pyTTkSlot(int)
+    def _appended(self, oldLen):
+        # Search only the new lines (and the previous last line that may have been partial)
+        indexes = None
+        if self._searchedText:
+            start, end = max(0,oldLen-1), None
+            if window := self._windowLines():
+                start, end = max(start, window[0]), window[1]
+            try:
+                if self._searchedQuery is not None:
+                    indexes = self._searchedQuery.search(self._fileBuffer, self._searchedICase, start, end)
+                else:
+                    indexes = self._fileBuffer.searchRe(self._searchedText, self._searchedICase, start, end)
+            except re.error:
+                # Wrong (i.e. half typed) pattern, already reported by the search
+                indexes = None
+        if indexes is not None:
+            with self._hitsMutex:
+                if self._searchDone:
+                    self._appendHits(oldLen, indexes)
+                else:
+                    # Appended while searching, the hits would be out of order
+                    self._appendedHits.append((oldLen, indexes))
+        self._topViewport.viewChanged.emit()
+        if self._bls_cb_scroll.checkState() == ttk.TTkK.Checked:
+            self._topViewport.moveToEnd()
+            self._bottomViewport.moveToEnd()
+
+    def _appendHits(self, oldLen, indexes):
+        '''Add the hits of the lines appended from "oldLen" (with _hitsMutex held)'''
+        if oldLen and oldLen-1 not in indexes[:1]:
+            # The previous last line (partial) may have been matched
+            if self._searchedHits is not None:
+                self._searchedHits.discard(oldLen-1)
+            self._bottomViewport.discardSearchedIndex(oldLen-1)
+            self._topViewport.discardSearchedIndex(oldLen-1)
+            self._minimap.discardSearchedIndex(oldLen-1)
+        if self._searchedHits is not None:
+            # Some lines may have been indexed before the search started
+            if self._searchedHits:
+                indexes = indexes[bisect_left(indexes, self._searchedHits[-1]):]
+            self._searchedHits.extend(indexes)
+        self._bottomViewport.appendSearchedIndexes(indexes)
+        self._topViewport.appendSearchedIndexes(indexes)
+        self._minimap.appendSearchedIndexes(indexes)
+
+    def _stopSearch(self):
+        # The worker is cancelled without _hitsMutex, it is held while emitting
+        if self._searchWorker:
+            self._searchWorker.cancel()
+            self._searchWorker = None
+        self._searchedText = ""
+        with self._hitsMutex:
+            self._searchedHits = TloggHitSet()
+            self._searchDone   = True
+            self._appendedHits = []
+        self._bottomViewport.fileSearched()
+
+    def _startSearch(self, lines=None):
+        # Only one search at time, the previous one (if still running) is dropped
+        if self._searchWorker:
+            self._searchWorker.cancel()
+        # The new search includes the lines appended so far
+        with self._hitsMutex:
+            self._searchedHits = TloggHitSet()
+            self._searchDone   = False
+            self._appendedHits = []
+        start, end = self._windowLines() or (0, None)
+        # The predefined filters combined in the search box (and the terms of
+        # a query) are searched (or taken from the cache) one by one,
+        # the results merged
+        if self._searchedQuery is not None:
+            worker = TloggQuerySearch(self._fileBuffer, self._searchedQuery, self._searchedICase, start, end)
+        elif lines is None and (filters := _filters(self._searchedText, [f['pattern'] for f in TloggCfg.filters])):
+            worker = TloggFiltersSearch(self._fileBuffer, filters, self._searchedICase, start, end)
+        else:
+            worker = TloggSearch(self._fileBuffer, self._searchedText, self._searchedICase, start, lines=lines, end=end)
+        self._searchWorker = worker
+        worker.found.connect(self._searchFound)
+        worker.progress.connect(self._bottomViewport.fileSearching)
+        worker.finished.connect(self._searchFinished)
+        self._bottomViewport.fileSearching(0.0)
+        worker.start()
+
+    @ttk.pyTTkSlot(list)
+    def _searchFound(self, indexes):
+        with self._hitsMutex:
+            if self._searchedHits is not None:
+                self._searchedHits.extend(indexes)
+            self._bottomViewport.appendSearchedIndexes(indexes)
+            self._topViewport.appendSearchedIndexes(indexes)
+            self._minimap.appendSearchedIndexes(indexes)
+
+    @ttk.pyTTkSlot()
+    def _searchFinished(self):
+        with self._hitsMutex:
+            self._searchDone = True
+            for oldLen, indexes in self._appendedHits:
+                self._appendHits(oldLen, indexes)
+            self._appendedHits = []
+        self._bottomViewport.fileSearched()
+
+    def _searchText(self, searchtext, ignoreCase, query=False):
+        # If the new text can only match a subset of the previous results
+        # (i.e. more characters typed) only those lines are searched again
+        lines = None
+        if ( not query and self._searchedQuery is None and
+             self._searchDone and self._searchedHits is not None and
+             len(self._searchedHits) < self._fileBuffer.getLen()//2 and
+             _narrows(self._searchedText, self._searchedICase, searchtext, ignoreCase) ):
+            lines = self._searchedHits.lines()
+        self._searchedText  = searchtext
+        self._searchedICase = ignoreCase
+        self._searchedQuery = None
+        highlight = searchtext
+        if query:
+            try:
+                self._searchedQuery = TloggQuery.fromText(searchtext)
+                highlight = self._searchedQuery.highlight()
+            except ValueError as e:
+                ttk.TTkLog.error(f"Search Query: {searchtext} - {e}")
+                highlight = ""
+        # The results are streamed in by the background search
+        if self._searchWorker:
+            self._searchWorker.cancel()
+        with self._hitsMutex:
+            self._searchDone   = False
+            self._appendedHits = []
+            self._bottomViewport.searchedIndexes(TloggHitSet())
+            self._topViewport.searchedIndexes(TloggHitSet())
+            self._minimap.searchedIndexes(TloggHitSet())
+        self._bottomViewport.searchRe(highlight)
+        self._topViewport.searchRe(highlight)
+        if query and self._searchedQuery is None:
+            # Wrong query, nothing is searched
+            self._stopSearch()
+            return
+        self._startSearch(lines)
+
+    def _windowLines(self):
+        '''Return the [start,end) lines of the time window searched, None if the whole file'''
+        if self._timeWindow is None: return None
+        return self._fileBuffer.timeWindow(*self._timeWindow)
+
+    @ttk.pyTTkSlot()
+    def _timeEntered(self):
+        # "14:32" jumps to the first line at that time,
+        # "14:30..14:45" (or the open "14:30..", "..14:45") limits
+        # the searches to the time window, an empty text removes it
+        text = str(self._bls_time.text()).strip()
+        if not text:
+            return self._setTimeWindow(None)
+        if (times := self._fileBuffer.timeIndex()) is None or not len(times):
+            ttk.TTkLog.warn(f"No timestamps found in: {self._fileBuffer.filename()}")
+            return
+        if '..' not in text:
+            if (time := times.toTime(text)) is None:
+                ttk.TTkLog.error(f"Wrong time: {text}")
+                return
+            self._topViewport.selectTime(time)
+            return
+        texts = [t.strip() for t in text.split('..', 1)]
+        window = tuple(times.toTime(t) if t else None for t in texts)
+        if any(time is None and t for time, t in zip(window, texts)):
+            ttk.TTkLog.error(f"Wrong time window: {text}")
+            return
+        self._setTimeWindow(window)
+
+    def _setTimeWindow(self, window):
+        if window == self._timeWindow: return
+        self._timeWindow = window
+        if self._searchedText:
+            # The previous hits can not be narrowed
+            self._searchedHits = None
+            self._searchText(self._searchedText, self._searchedICase, self._searchedQuery is not None)
+
+    @ttk.pyTTkSlot()
+    def _searchTextChanged(self):
+        # Restart the countdown at every keystroke
+        self._searchTimer.start(TloggCfg.options.get('searchDelay', 0.3))
+
+    @ttk.pyTTkSlot()
+    def _searchSelected(self):
+        self._searchTimer.stop()
+        self._searchTyped()
+
+    @ttk.pyTTkSlot()
+    def _searchTyped(self):
         searchtext = str(self._bls_searchbox.currentText())
+        ignoreCase = self._bls_cb_icase.checkState() == ttk.TTkK.Checked
+        query      = self._bls_cb_query.checkState() == ttk.TTkK.Checked
+        if (searchtext, ignoreCase, query) == (self._searchedText, self._searchedICase, self._searchedQuery is not None):
+            return
         ttk.TTkLog.debug(f"{searchtext=}")
-        indexes = self._fileBuffer.searchRe(searchtext, ignoreCase=self._bls_cb_icase.checkState() == ttk.TTkK.Checked)
-        self._bottomViewport.searchedIndexes(indexes)
-        self._bottomViewport.searchRe(searchtext)
-        self._topViewport.searchedIndexes(indexes)
-        self._topViewport.searchRe(searchtext)
+        self._searchText(searchtext, ignoreCase, query)
+
+    @ttk.pyTTkSlot()
+    def _search(self):
+        # Explicit search, the text is stored in the history
+        self._searchTimer.stop()
+        searchtext = str(self._bls_searchbox.currentText())
+        self._searchTyped()
         if TloggCfg.searches:
             x = set(TloggCfg.searches)
             ttk.TTkLog.debug(f"{x}")
@@ -38,6 +38,7 @@ from .loggwidget import LoggWidget
 from .options import optionsFormLayout, optionsLoadTheme
 from .highlighters import highlightersFormLayout
 from .predefinedfilters import PredefinedFiltersFormWindow
+from .globalsearch import GlobalSearchWindow
 from .notepad import NotePad
 
 
@@ -59,10 +60,11 @@ class TLOGG(TTkGridLayout):
         │ Logger,Debug View                        │
         └──────────────────────────────────────────┘
     '''
-    __slots__ = ('_kodeTab', '_tloggProxy','_notepad')
+    __slots__ = ('_kodeTab', '_tloggProxy','_notepad', '_loggWidgets')
     def __init__(self, tloggProxy, *args, **kwargs) -> None:
         self._tloggProxy = tloggProxy
         self._notepad = NotePad()
+        self._loggWidgets = []
 
         super().__init__(*args, **kwargs)
 
@@ -86,6 +88,7 @@ class TLOGG(TTkGridLayout):
 
         extraMenu = appMenuBar.addMenu("E&xtra")
         extraMenu.addMenu("Scratchpad").menuButtonClicked.connect(self.scratchpad)
+        extraMenu.addMenu("Search all files...").menuButtonClicked.connect(self.showGlobalSearch)
         extraMenu.addSpacer()
 
         helpMenu = appMenuBar.addMenu("&Help", alignment=TTkK.RIGHT_ALIGN)
@@ -96,6 +99,7 @@ class TLOGG(TTkGridLayout):
             tloggProxy.tloggFocussed.emit(None, data)
 
         self._kodeTab.currentChanged.connect(_tabChanged)
+        self._kodeTab.tabCloseRequested.connect(self._tabCloseRequested)
 
         # fileTree.fileActivated.connect(lambda x: self.openFile(x.path()))
 
@@ -116,6 +120,37 @@ class TLOGG(TTkGridLayout):
         appTemplate.setWidget(self._kodeTab, TTkAppTemplate.MAIN)
         appTemplate.setWidget(TTkLogViewer(),TTkAppTemplate.BOTTOM,size=1,title="Logs")
 
+    @pyTTkSlot(TTkTabWidget, int)
+    def _tabCloseRequested(self, tabWidget, index):
+        # The same signal is emitted when a tab is dragged around
+        if TTkHelper.isDnD(): return
+        if isinstance(widget := tabWidget.widget(index), LoggWidget):
+            widget.closeFile()
+            if widget in self._loggWidgets:
+                self._loggWidgets.remove(widget)
+
+    def _openedFiles(self):
+        '''The (widget, fileBuffer) of the opened files in the opening order'''
+        return [(w, w.fileBuffer()) for w in self._loggWidgets]
+
+    @pyTTkSlot(object, int)
+    def _globalSearchSelected(self, widget, line):
+        # Move to the tab holding the file, the nearest TTkTabWidget parent
+        tab = widget.parentWidget()
+        while tab and not isinstance(tab, TTkTabWidget):
+            tab = tab.parentWidget()
+        if tab:
+            tab.setCurrentWidget(widget)
+        widget.selectLine(line)
+
+    @pyTTkSlot(TTkMenuButton)
+    def showGlobalSearch(self, btn):
+        win = GlobalSearchWindow(self._openedFiles,
+                title="Search all files...", size=(100,30), border=True,
+                flags=TTkK.WindowFlag.WindowMaximizeButtonHint|TTkK.WindowFlag.WindowCloseButtonHint)
+        win.selected.connect(self._globalSearchSelected)
+        TTkHelper.overlay(btn, win, 10,2, toolWindow=True)
+
     @pyTTkSlot()
     def scratchpad(self):
         win = TTkWindow(
@@ -164,6 +199,7 @@ class TLOGG(TTkGridLayout):
     def openFile(self, file):
         # openedFiles.append(file)
         loggWidget = LoggWidget(file)
+        self._loggWidgets.append(loggWidget)
         self._kodeTab.addTab(widget=loggWidget, label=os.path.basename(file), data=file)
         self._kodeTab.setCurrentWidget(loggWidget)
 
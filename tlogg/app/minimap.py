@@ -0,0 +1,308 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggDensity', 'FileViewerMinimap']
+
+import re
+from array import array
+
+import TermTk as ttk
+
+from .cfg    import TloggCfg
+from .hitset import TloggHitSet
+from .search import TloggFiltersSearch
+
+class TloggDensity():
+    '''
+    Number of lines (i.e. hits) in bins of 2^_shift lines
+
+    The bins are updated incrementally, only the ones of the lines added or
+    removed; when the lines exceed _maxBins bins, the bins are merged
+    in pairs (the bin size doubled).
+    '''
+    _maxBins = 0x1000
+
+    __slots__ = ('_shift', '_bins')
+    def __init__(self, shift=0):
+        self._shift = shift
+        self._bins = array('I')
+
+    def shift(self) -> int:
+        return self._shift
+
+    def _coarsen(self, shift):
+        while self._shift < shift:
+            bins = self._bins
+            merged = array('I', map(sum, zip(bins[0::2], bins[1::2])))
+            if len(bins)%2:
+                merged.append(bins[-1])
+            self._bins = merged
+            self._shift += 1
+
+    def _fit(self, line) -> int:
+        '''Return the bin of the line, the bins are extended/merged to include it'''
+        shift = self._shift
+        while (line >> shift) >= self._maxBins:
+            shift += 1
+        self._coarsen(shift)
+        if (pos := line >> shift) >= len(self._bins):
+            self._bins.extend([0]*(pos+1-len(self._bins)))
+        return pos
+
+    def add(self, lines):
+        '''Add the sorted lines'''
+        if not lines: return
+        self._fit(lines[-1])
+        bins, shift = self._bins, self._shift
+        for line in lines:
+            bins[line >> shift] += 1
+
+    def remove(self, line):
+        if (pos := line >> self._shift) < len(self._bins) and self._bins[pos]:
+            self._bins[pos] -= 1
+
+    def clear(self):
+        self._bins = array('I')
+
+    def sum(self, first, last) -> int:
+        '''Return the lines counted in the bins covering [first,last)'''
+        shift = self._shift
+        return sum(self._bins[first >> shift:((max(first+1,last)-1) >> shift)+1])
+
+class FileViewerMinimap(ttk.TTkWidget):
+    '''
+    A column beside the file viewer with the density of
+    the search hits (and the marks) and of the highlighted lines,
+    each row covers a slice of the file, clicking a row jumps there.
+
+    The lines of each highlighter rule (the first rule matching, as painted)
+    are counted in background once the file is indexed, again only the
+    appended lines in follow mode; the count scans the whole file
+    so it is disabled by default (option "minimapColors").
+    '''
+    _levels = ' ▁▂▃▄▅▆▇█'
+
+    __slots__ = ('_fileBuffer', '_fileView', '_hits', '_lastHit', '_marks',
+                 '_indexed', '_colors', '_colorsKey', '_countedEnd',
+                 '_counters', '_counted', '_counter',
+                 # Signals
+                 'selected')
+    def __init__(self, *args, **kwargs):
+        self._fileBuffer = kwargs.get('filebuffer')
+        self._fileView   = kwargs.get('fileView')
+        self._hits    = TloggDensity()
+        self._lastHit = -1
+        self._marks   = TloggDensity()
+        self._indexed = False
+        # The density of each highlighter rule (TloggCfg.colors)
+        # of the lines up to _countedEnd
+        self._colors    = []
+        self._colorsKey = None
+        self._countedEnd = 0
+        self._counters  = []
+        self._counted   = {}
+        self._counter   = None
+        # Signals
+        self.selected = ttk.pyTTkSignal(int)
+        super().__init__(*args, **kwargs|{'minWidth':2, 'maxWidth':2})
+        if self._fileView:
+            self._fileView.viewMovedTo.connect(self._viewMoved)
+        if self._fileBuffer:
+            self._fileBuffer.indexed.connect(self.fileIndexed)
+            self._indexed = not self._fileBuffer.isIndexing()
+
+    @staticmethod
+    def colorsEnabled() -> bool:
+        return TloggCfg.options.get('minimapColors', False)
+
+    def cancel(self):
+        '''Stop the count of the highlighted lines'''
+        if self._counter:
+            self._counter.cancel()
+            self._counter = None
+
+    @ttk.pyTTkSlot(int, int)
+    def _viewMoved(self, x, y):
+        self.update()
+
+    @ttk.pyTTkSlot()
+    def fileIndexed(self):
+        self._indexed = True
+        self.update()
+
+    def searchedIndexes(self, indexes):
+        self._hits.clear()
+        self._hits.add(indexes)
+        self._lastHit = indexes[-1] if indexes else -1
+        self.update()
+
+    def appendSearchedIndexes(self, indexes):
+        # The first new hit may be the last partial line already counted
+        if indexes and indexes[0] == self._lastHit:
+            indexes = indexes[1:]
+        if not indexes: return
+        self._hits.add(indexes)
+        self._lastHit = indexes[-1]
+        self.update()
+
+    def discardSearchedIndex(self, line):
+        # Only the last (partial) line is discarded
+        if line == self._lastHit:
+            self._hits.remove(line)
+            self._lastHit = -1
+            self.update()
+
+    @ttk.pyTTkSlot(TloggHitSet)
+    def markIndexes(self, indexes):
+        self._marks.clear()
+        self._marks.add(indexes)
+        self.update()
+
+    @ttk.pyTTkSlot()
+    def fileReloaded(self):
+        self._hits.clear()
+        self._marks.clear()
+        self._lastHit = -1
+        # The highlighted lines are counted again
+        self.cancel()
+        self._colorsKey = None
+        self.update()
+
+    @ttk.pyTTkSlot(int)
+    def fileAppended(self, oldLen):
+        # The lines appended while counting are counted once finished
+        if self._colorsKey is not None and self._counter is None:
+            self._countColors(self._countedEnd)
+
+    @staticmethod
+    def _valid(pattern, ignoreCase) -> bool:
+        try:
+            re.compile(pattern, re.IGNORECASE if ignoreCase else 0)
+        except re.error:
+            return False
+        return True
+
+    def _checkColors(self):
+        '''Start (or drop) the count if the option or the rules (TloggCfg.colors) have been changed'''
+        if not self.colorsEnabled():
+            if self._colorsKey is not None:
+                self.cancel()
+                self._colorsKey = None
+                self._colors = []
+            return
+        if self._indexed and self._colorsKey != [(c['pattern'], c['ignorecase']) for c in TloggCfg.colors]:
+            self._countColors()
+
+    def _countColors(self, start=0):
+        '''Count the lines of each highlighter rule from "start" to the last indexed line'''
+        self.cancel()
+        colors = [(c['pattern'], c['ignorecase']) for c in TloggCfg.colors]
+        if start == 0:
+            self._colorsKey = colors
+            self._colors = [TloggDensity() for _ in colors]
+        end = self._fileBuffer.getIndexedLen()
+        # A single pass for each case sensitivity,
+        # wrong patterns never match (as in the highlighter)
+        self._counters = [ (ignoreCase, [p for p,i in dict.fromkeys(self._colorsKey)
+                                         if i == ignoreCase and self._valid(p, i)])
+                           for ignoreCase in (True, False) ]
+        self._counted = {}
+        self._startCounter(start, end)
+
+    def _startCounter(self, start, end):
+        while self._counters:
+            ignoreCase, patterns = self._counters.pop(0)
+            if patterns:
+                self._counter = counter = TloggFiltersSearch(self._fileBuffer, patterns, ignoreCase, start, end)
+                counter.finished.connect(lambda: self._colorsCounted(counter, ignoreCase, start, end))
+                counter.start()
+                return
+        self._counter = None
+        self._countedEnd = end
+        # The lines are assigned to the first rule matching
+        taken = TloggHitSet()
+        for pos, rule in enumerate(self._colorsKey):
+            if pos >= len(self._colors) or (hits := self._counted.get(rule)) is None:
+                continue
+            lines = hits.difference(taken)
+            self._colors[pos].add(lines)
+            taken = taken.union(lines)
+        self._counted = {}
+        self.update()
+        # Lines appended while counting
+        if self._fileBuffer.getIndexedLen() > end:
+            self._countColors(end)
+
+    def _colorsCounted(self, counter, ignoreCase, start, end):
+        if counter is not self._counter: return
+        for pattern, hits in counter.hits().items():
+            self._counted[(pattern, ignoreCase)] = hits
+        self._startCounter(start, end)
+
+    def mousePressEvent(self, evt) -> bool:
+        total = self._fileBuffer.getLen()
+        if total and 0 <= evt.y < self.height():
+            self.selected.emit(min(total-1, evt.y*total//self.height()))
+        return True
+
+    def mouseDragEvent(self, evt) -> bool:
+        return self.mousePressEvent(evt)
+
+    def _level(self, value, maxValue) -> str:
+        if not value: return ' '
+        levels = len(self._levels)-1
+        return self._levels[max(1, (levels*value+maxValue-1)//maxValue)]
+
+    def paintEvent(self, canvas):
+        self._checkColors()
+        h = self.height()
+        total = self._fileBuffer.getLen()
+        if not h or not total: return
+        rows  = [(r*total//h, (r+1)*total//h) for r in range(h)]
+        hits  = [self._hits.sum(*r) for r in rows]
+        marks = [self._marks.sum(*r) for r in rows]
+        colors = [[d.sum(*r) for r in rows] for d in self._colors]
+        maxHits   = max(hits) or 1
+        maxColors = max((max(c) for c in colors), default=0) or 1
+        # The rows displayed in the file viewer
+        visible = (-1,-1)
+        if self._fileView:
+            _,oy = self._fileView.getViewOffsets()
+            visible = (oy*h//total, (oy+self._fileView.height())*h//total)
+        hitColor  = ttk.TTkColor.fg("#ff0000")
+        markColor = ttk.TTkColor.fg("#00ffff")
+        for y in range(h):
+            bg = ttk.TTkColor.bg("#444444") if visible[0] <= y <= visible[1] else ttk.TTkColor.RST
+            if marks[y]:
+                canvas.drawText(pos=(0,y), text='❥', color=markColor+bg)
+            else:
+                canvas.drawText(pos=(0,y), text=self._level(hits[y], maxHits), color=hitColor+bg)
+            # The prevalent rule in the row
+            best, value = None, 0
+            for pos, c in enumerate(colors):
+                if c[y] > value:
+                    best, value = pos, c[y]
+            if best is not None and best < len(TloggCfg.colors):
+                color = ttk.TTkColor.fg(TloggCfg.colors[best]['bg'])
+                canvas.drawText(pos=(1,y), text=self._level(value, maxColors), color=color+bg)
+            else:
+                canvas.drawText(pos=(1,y), text=' ', color=bg)
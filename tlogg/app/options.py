@@ -27,6 +27,10 @@ __all__ = ['optionsLoadTheme', 'optionsFormLayout']
 import copy
 
 from . import TloggCfg, TloggGlbl
+from .linecache import TloggLineCache
+from .searchcache import TloggSearchCache
+from .trigramindex import TloggTrigramIndex
+from .minimap import FileViewerMinimap
 
 from TermTk import *
 
@@ -50,10 +54,40 @@ def optionsFormLayout(win):
     themesFrame.layout().addWidget(r2 := TTkRadioButton(text="UTF-8", name="theme", checked=options['theme'] == 'UTF8'))
     themesFrame.layout().addWidget(r3 := TTkRadioButton(text="Nerd",  name="theme", checked=options['theme'] == 'NERD'))
 
+    # Shared lines cache, budget and statistics
+    stats = TloggLineCache.stats()
+    cacheFrame = TTkFrame(title="Lines Cache", border=True, layout=TTkGridLayout(), maxHeight=5, minHeight=5)
+    cacheFrame.layout().addWidget(TTkLabel(text="Size (MB):"),0,0)
+    cacheFrame.layout().addWidget(cacheSize := TTkSpinBox(value=stats['budget']//0x100000, minimum=1, maximum=0x10000),0,1)
+    cacheFrame.layout().addWidget(TTkLabel(text=f"Hits:{stats['hits']} Misses:{stats['misses']}"),1,0,1,2)
+    cacheFrame.layout().addWidget(TTkLabel(text=f"Evictions:{stats['evictions']} Resident:{stats['resident']/0x100000:.1f}MB"),2,0,1,2)
+
+    # Shared search results cache, budget and statistics
+    stats = TloggSearchCache.stats()
+    searchCacheFrame = TTkFrame(title="Search Cache", border=True, layout=TTkGridLayout(), maxHeight=5, minHeight=5)
+    searchCacheFrame.layout().addWidget(TTkLabel(text="Size (MB):"),0,0)
+    searchCacheFrame.layout().addWidget(searchCacheSize := TTkSpinBox(value=stats['budget']//0x100000, minimum=1, maximum=0x10000),0,1)
+    searchCacheFrame.layout().addWidget(TTkLabel(text=f"Hits:{stats['hits']} Misses:{stats['misses']}"),1,0,1,2)
+    searchCacheFrame.layout().addWidget(TTkLabel(text=f"Entries:{stats['entries']} Resident:{stats['resident']/0x100000:.1f}MB"),2,0,1,2)
+
+    # Persistent trigram index (opt-in), used when the files are opened
+    trigramFrame = TTkFrame(title="Trigram Index", border=True, layout=TTkGridLayout(), maxHeight=5, minHeight=5)
+    trigramFrame.layout().addWidget(trigramEnabled := TTkCheckbox(text="Enabled", checked=TloggTrigramIndex.enabled()),0,0,1,2)
+    trigramFrame.layout().addWidget(TTkLabel(text="Block (KB):"),1,0)
+    trigramFrame.layout().addWidget(trigramBlockSize := TTkSpinBox(value=TloggTrigramIndex.blockSize()//0x400, minimum=4, maximum=0x100000),1,1)
+
+    # Density of the highlighted lines in the minimap (opt-in), scans the whole files
+    minimapFrame = TTkFrame(title="Minimap", border=True, layout=TTkGridLayout(), maxHeight=3, minHeight=3)
+    minimapFrame.layout().addWidget(minimapColors := TTkCheckbox(text="Highlighted lines", checked=FileViewerMinimap.colorsEnabled()),0,0)
+
     retLayout.addWidget(themesFrame,0,0)
-    retLayout.addWidget(TTkSpacer() ,1,0,1,2)
+    retLayout.addWidget(cacheFrame,0,1)
+    retLayout.addWidget(trigramFrame,1,0)
+    retLayout.addWidget(searchCacheFrame,1,1)
+    retLayout.addWidget(minimapFrame,2,0)
+    retLayout.addWidget(TTkSpacer() ,3,0,1,2)
 
-    retLayout.addItem(bottomLayout ,2,0,1,2)
+    retLayout.addItem(bottomLayout ,4,0,1,2)
     bottomLayout.addWidget(applyBtn  := TTkButton(text="Apply",  border=True, maxHeight=3),0,1)
     bottomLayout.addWidget(cancelBtn := TTkButton(text="Cancel", border=True, maxHeight=3),0,2)
     bottomLayout.addWidget(okBtn     := TTkButton(text="OK",     border=True, maxHeight=3),0,3)
@@ -62,6 +96,11 @@ def optionsFormLayout(win):
         if r1.checkState() == TTkK.Checked: options['theme'] = 'ASCII'
         if r2.checkState() == TTkK.Checked: options['theme'] = 'UTF8'
         if r3.checkState() == TTkK.Checked: options['theme'] = 'NERD'
+        options['cacheSize'] = cacheSize.value()*0x100000
+        options['searchCacheSize'] = searchCacheSize.value()*0x100000
+        options['trigramIndex'] = trigramEnabled.checkState() == TTkK.Checked
+        options['trigramBlockSize'] = trigramBlockSize.value()*0x400
+        options['minimapColors'] = minimapColors.checkState() == TTkK.Checked
         TloggCfg.options = options
         TloggCfg.save(searches=False, filters=False, colors=False, options=True)
         optionsLoadTheme(options['theme'])
@@ -28,6 +28,7 @@ import copy
 from readline import insert_text
 
 from . import TloggCfg, TloggGlbl
+from .search import TloggFiltersSearch
 
 from TermTk import *
 
@@ -143,13 +144,20 @@ class PredefinedFiltersFormWindow(TTkWindow):
 
 
 class PredefinedFilters(TTkResizableFrame):
-    __slots__ = ('checked', 'unchecked', '_searchbox')
-    def __init__(self, searchbox):
+    '''
+    The checkboxes add/remove the filters from the search box,
+    the lines matched by each filter are counted (all the filters
+    in a single pass) when a fileBuffer is provided
+    '''
+    __slots__ = ('checked', 'unchecked', '_searchbox', '_checkboxes', '_counter')
+    def __init__(self, searchbox, fileBuffer=None, ignoreCase=False):
+        self._counter = None
         layout=TTkVBoxLayout()
         TTkResizableFrame.__init__(self, layout=layout)
         self._name = 'PredefinedFilters'
 
         self._searchbox = searchbox
+        self._checkboxes = []
 
         filters = copy.deepcopy(TloggCfg.filters)
         for filter in filters:
@@ -173,8 +181,40 @@ class PredefinedFilters(TTkResizableFrame):
                     sb.setCurrentText(txt)
                 return _ret
 
-            layout.addWidget(cb := TTkCheckbox(text=filter['name'],checked=searchbox.currentText().find(filter['pattern'])!=-1))
+            text = filter['name'] if fileBuffer is None else f"{filter['name']} (...)"
+            layout.addWidget(cb := TTkCheckbox(text=text,checked=searchbox.currentText().find(filter['pattern'])!=-1))
             cb.stateChanged.connect(_cb(filter['pattern'], searchbox))
+            self._checkboxes.append((cb, filter))
         w,h = self.minimumSize()
         self.resize(w,h)
 
+        self.closed.connect(self.cancel)
+        if fileBuffer is not None and filters:
+            self._count(fileBuffer, filters, ignoreCase)
+
+    def _count(self, fileBuffer, filters, ignoreCase):
+        self.cancel()
+        self._counter = TloggFiltersSearch(fileBuffer, [f['pattern'] for f in filters], ignoreCase)
+        self._counter.finished.connect(self._counted)
+        self._counter.start()
+
+    @pyTTkSlot()
+    def cancel(self):
+        '''Stop the count of the filters, still scanning the file after the overlay is gone'''
+        if self._counter is not None:
+            self._counter.cancel()
+
+    def setParent(self, parent):
+        # The overlay is dismissed removing it from the root layout
+        if parent is None:
+            self.cancel()
+        super().setParent(parent)
+
+    @pyTTkSlot()
+    def _counted(self):
+        hits = self._counter.hits()
+        for cb, filter in self._checkboxes:
+            if (h := hits.get(filter['pattern'])) is not None:
+                cb.setText(f"{filter['name']} ({len(h)})")
+        w,h = self.minimumSize()
+        self.resize(max(w,self.width()),h)
@@ -0,0 +1,167 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggPrefilter']
+
+import re
+
+try:
+    from re import _parser as _reParser
+    from re import _constants as _reConstants
+except ImportError: # python < 3.11
+    import sre_parse as _reParser
+    import sre_constants as _reConstants
+
+_LITERAL    = _reConstants.LITERAL
+_BRANCH     = _reConstants.BRANCH
+_SUBPATTERN = _reConstants.SUBPATTERN
+_ASSERT     = _reConstants.ASSERT
+_REPEATS    = tuple(getattr(_reConstants, op) for op in
+                    ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT') if hasattr(_reConstants, op))
+_ATOMIC     = getattr(_reConstants, 'ATOMIC_GROUP', None)
+
+def _score(literals):
+    # The shortest alternative is the one producing more candidates
+    return min(map(len, literals)), -len(literals)
+
+def _required(items):
+    '''
+    Return the literals (alternatives) that any match of the parsed
+    sequence must contain, None if there are no such literals
+    '''
+    best = None
+    run  = []
+    def _consider(literals):
+        nonlocal best
+        if literals and (best is None or _score(literals) > _score(best)):
+            best = literals
+    for op, av in items:
+        if op is _LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            _consider([''.join(run)])
+            run = []
+        if op is _SUBPATTERN:
+            _, addFlags, delFlags, p = av
+            # The case sensitivity can not change in the middle
+            if not (addFlags|delFlags) & re.IGNORECASE:
+                _consider(_required(p))
+        elif op is _BRANCH:
+            _, branches = av
+            branches = [_required(b) for b in branches]
+            if all(branches):
+                _consider(sorted({l for b in branches for l in b}))
+        elif op in _REPEATS:
+            minRepeat, _, p = av
+            if minRepeat >= 1:
+                _consider(_required(p))
+        elif op is _ATOMIC:
+            _consider(_required(av))
+        elif op is _ASSERT:
+            # The positive lookahead/lookbehind are still in the line
+            _, p = av
+            _consider(_required(p))
+    if run:
+        _consider([''.join(run)])
+    return best
+
+class TloggPrefilter():
+    '''
+    The literals required by a regex,
+    the raw bytes are scanned for them (bytes.find) and the regex
+    is evaluated only on the lines containing at least one of them.
+
+    If the candidate lines are too dense (_maxDensity candidates per line)
+    the plain search of the decoded lines is faster, the prefilter stops.
+    '''
+    _minLength = 3
+    _maxDensity = 1/16
+    _maxDensityIgnoreCase = 1/3
+
+    __slots__ = ('_literals', '_ignoreCase')
+    def __init__(self, literals, ignoreCase=False):
+        self._ignoreCase = ignoreCase
+        if ignoreCase:
+            self._literals = [l.lower().encode() for l in literals]
+        else:
+            self._literals = [l.encode() for l in literals]
+
+    def literals(self):
+        return self._literals
+
+    @staticmethod
+    def requiredLiterals(rr):
+        '''Return the literals (alternatives) required by any match of a compiled (str) regex or None'''
+        try:
+            literals = _required(_reParser.parse(rr.pattern, rr.flags))
+        except Exception:
+            return None
+        # The undecodable bytes are replaced in the lines
+        if not literals or any('�' in l for l in literals):
+            return None
+        return literals
+
+    @staticmethod
+    def fromRegex(rr):
+        '''Return the prefilter of a compiled (str) regex or None if it has no useful literals'''
+        literals = TloggPrefilter.requiredLiterals(rr)
+        if not literals or min(map(len, literals)) < TloggPrefilter._minLength:
+            return None
+        ignoreCase = bool(rr.flags & re.IGNORECASE)
+        if ignoreCase and not all(l.isascii() for l in literals):
+            return None
+        return TloggPrefilter(literals, ignoreCase)
+
+    def search(self, rr, data, line):
+        '''
+        Search the lines in data (whole lines numbered from "line"),
+        return the matching lines and the (line, offset) where the
+        prefilter stopped, the rest of the data is not searched
+        '''
+        haystack = data
+        if self._ignoreCase:
+            # Some non ASCII chars match the ASCII ones ignoring the case
+            # (i.e. the Kelvin sign), bytes.lower() preserve the positions
+            if not data.isascii(): return [], line, 0
+            haystack = data.lower()
+        maxDensity = self._maxDensityIgnoreCase if self._ignoreCase else self._maxDensity
+        ret = []
+        literals = self._literals
+        nexts = [haystack.find(l) for l in literals]
+        first = line
+        counted = 0
+        candidates = 0
+        while found := [p for p in nexts if p >= 0]:
+            pos   = min(found)
+            start = data.rfind(b'\n', counted, pos)+1 or counted
+            line += data.count(b'\n', counted, start)
+            counted = start
+            candidates += 1
+            if candidates > 32 and candidates > (line-first)*maxDensity:
+                return ret, line, start
+            end = data.find(b'\n', pos)+1 or len(data)
+            if rr.search(data[start:end].decode('utf-8', errors='replace')):
+                ret.append(line)
+            # Only the literals found in this line need to be searched again
+            nexts = [haystack.find(l, end) if 0 <= p < end else p for p,l in zip(nexts, literals)]
+        return ret, line, len(data)
@@ -0,0 +1,177 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggQuery']
+
+import re
+
+from .hitset import TloggHitSet
+
+_reToken = re.compile(r'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+_keywords = ('AND', 'OR', 'NOT')
+
+class TloggQuery():
+    '''
+    Boolean query over regexes, i.e.:
+
+        ERROR AND NOT healthcheck AND (service=auth OR "user \d+ denied")
+
+    The terms are regexes, quoted (\" for a quote) if containing spaces,
+    parentheses or quotes; AND is implicit between two terms, NOT binds
+    tighter than AND, AND tighter than OR.
+
+    The negated terms are only subtracted from the positive ones,
+    a query negated as a whole (i.e. NOT healthcheck) is refused.
+
+    Each term is searched on its own (and cached), the expression is
+    evaluated combining the hit sets of the terms.
+    '''
+    __slots__ = ('_text', '_tree', '_terms')
+    def __init__(self, text):
+        self._text = text
+        self._terms = []
+        tokens = self._tokenize(text)
+        self._tree, pos = self._parseOr(tokens, 0)
+        if tokens[pos][0] != 'end':
+            raise ValueError(f"Unexpected {tokens[pos][0]}")
+        if self._negated(self._tree):
+            raise ValueError("A positive term is required (i.e. ERROR AND NOT healthcheck)")
+
+    @staticmethod
+    def fromText(text):
+        '''Return the parsed query, raise ValueError if the syntax is wrong'''
+        return TloggQuery(text)
+
+    def text(self) -> str:
+        return self._text
+
+    def terms(self) -> list:
+        '''Return the regexes of the terms (no duplicates)'''
+        return self._terms
+
+    def highlight(self) -> str:
+        '''Return the regex matching the terms not negated, to be highlighted'''
+        def _positive(node, negated):
+            if node[0] == 'term':
+                return [] if negated else [node[1]]
+            if node[0] == 'not':
+                return _positive(node[1], not negated)
+            return _positive(node[1], negated) + _positive(node[2], negated)
+        return '|'.join(f"(?:{t})" for t in dict.fromkeys(_positive(self._tree, False)))
+
+    @staticmethod
+    def _negated(node) -> bool:
+        '''Return True if the node matches the lines NOT in the set evaluated (see evaluate())'''
+        if node[0] == 'term':
+            return False
+        if node[0] == 'not':
+            return not TloggQuery._negated(node[1])
+        na, nb = TloggQuery._negated(node[1]), TloggQuery._negated(node[2])
+        return (na and nb) if node[0] == 'and' else (na or nb)
+
+    def evaluate(self, hits, start, end) -> TloggHitSet:
+        '''
+        Return the lines in [start,end) matching the query,
+        "hits" is the TloggHitSet of each term (in the same range)
+        '''
+        # Each node is evaluated to (set, negated), the negated sets
+        # (i.e. NOT x) are never complemented, only subtracted, the
+        # query as a whole is never negated (see _negated())
+        def _eval(node):
+            if node[0] == 'term':
+                return hits[node[1]], False
+            if node[0] == 'not':
+                s, negated = _eval(node[1])
+                return s, not negated
+            (a, na), (b, nb) = _eval(node[1]), _eval(node[2])
+            if node[0] == 'and':
+                if not na and not nb: return a.intersection(b), False
+                if not na:            return a.difference(b), False
+                if not nb:            return b.difference(a), False
+                return a.union(b), True
+            else:
+                if not na and not nb: return a.union(b), False
+                if not na:            return b.difference(a), True
+                if not nb:            return a.difference(b), True
+                return a.intersection(b), True
+        s, _ = _eval(self._tree)
+        return s
+
+    def search(self, fileBuffer, ignoreCase=False, start=0, end=None) -> list:
+        '''Return the indexed lines, in [start,end), matching the query'''
+        end = fileBuffer.getIndexedLen() if end is None else min(end, fileBuffer.getIndexedLen())
+        hits = {t:TloggHitSet(fileBuffer.searchRe(t, ignoreCase, start, end)) for t in self._terms}
+        return self.evaluate(hits, start, end).tolist()
+
+    @staticmethod
+    def _tokenize(text) -> list:
+        tokens = []
+        pos = 0
+        while pos < len(text):
+            if not (m := _reToken.match(text, pos)):
+                if text[pos:].strip():
+                    raise ValueError(f"Unterminated quote at {pos}")
+                break
+            pos = m.end()
+            opened, closed, quoted, word = m.groups()
+            if opened:             tokens.append(('(',))
+            elif closed:           tokens.append((')',))
+            elif quoted is not None: tokens.append(('term', quoted.replace('\\"','"')))
+            elif word in _keywords: tokens.append((word,))
+            elif word:             tokens.append(('term', word))
+        tokens.append(('end',))
+        return tokens
+
+    def _parseOr(self, tokens, pos):
+        left, pos = self._parseAnd(tokens, pos)
+        while tokens[pos][0] == 'OR':
+            right, pos = self._parseAnd(tokens, pos+1)
+            left = ('or', left, right)
+        return left, pos
+
+    def _parseAnd(self, tokens, pos):
+        left, pos = self._parseNot(tokens, pos)
+        while tokens[pos][0] in ('AND', 'NOT', 'term', '('):
+            if tokens[pos][0] == 'AND':
+                pos += 1
+            right, pos = self._parseNot(tokens, pos)
+            left = ('and', left, right)
+        return left, pos
+
+    def _parseNot(self, tokens, pos):
+        if tokens[pos][0] == 'NOT':
+            node, pos = self._parseNot(tokens, pos+1)
+            return ('not', node), pos
+        return self._parseAtom(tokens, pos)
+
+    def _parseAtom(self, tokens, pos):
+        token = tokens[pos]
+        if token[0] == 'term':
+            if token[1] not in self._terms:
+                self._terms.append(token[1])
+            return token, pos+1
+        if token[0] == '(':
+            node, pos = self._parseOr(tokens, pos+1)
+            if tokens[pos][0] != ')':
+                raise ValueError("Missing )")
+            return node, pos+1
+        raise ValueError(f"Expected a term, found {token[0]}")
@@ -0,0 +1,231 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggSearch', 'TloggFiltersSearch', 'TloggQuerySearch', 'TloggGlobalSearch']
+
+import re
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import TermTk as ttk
+
+from .hitset     import TloggHitSet
+from .filebuffer import TloggFileBuffer
+
+class TloggSearch():
+    '''
+    Search a TloggFileBuffer in a background thread.
+
+    The hits are emitted in batches (at most every _interval seconds)
+    while the file is scanned, once cancelled no more signals are emitted.
+    If "lines" is provided, only those lines are searched,
+    "end" limits the search to the lines before it (i.e. a time window).
+    '''
+    _interval = 0.2
+
+    __slots__ = (
+        '_fileBuffer', '_regex', '_ignoreCase', '_start', '_end', '_lines',
+        '_cancelled', '_lock',
+        # Signals
+        'found', 'progress', 'finished')
+    def __init__(self, fileBuffer, regex, ignoreCase=False, start=0, lines=None, end=None):
+        self._fileBuffer = fileBuffer
+        self._regex = regex
+        self._ignoreCase = ignoreCase
+        self._start = start
+        self._end = end
+        self._lines = lines
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        # Signals
+        self.found    = ttk.pyTTkSignal(list)
+        self.progress = ttk.pyTTkSignal(float)
+        self.finished = ttk.pyTTkSignal()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled.set()
+
+    def isCancelled(self):
+        return self._cancelled.is_set()
+
+    def _emit(self, indexes, progress):
+        # The check and the emit are atomic with respect to cancel()
+        with self._lock:
+            if self._cancelled.is_set(): return False
+            if indexes:
+                self.found.emit(indexes)
+            self.progress.emit(progress)
+        return True
+
+    def _batches(self):
+        return self._fileBuffer.searchReBatches(self._regex, self._ignoreCase, self._start, lines=self._lines, end=self._end)
+
+    def _run(self):
+        hits = []
+        lastEmit = time.time()
+        try:
+            for indexes, progress in self._batches():
+                if self._cancelled.is_set(): return
+                hits += indexes
+                if time.time() - lastEmit > self._interval:
+                    if not self._emit(hits, progress): return
+                    hits = []
+                    lastEmit = time.time()
+        except re.error as e:
+            ttk.TTkLog.error(f"Search RE: {self._regex} - {e}")
+        with self._lock:
+            if self._cancelled.is_set(): return
+            if hits:
+                self.found.emit(hits)
+            self.finished.emit()
+
+
+class TloggFiltersSearch(TloggSearch):
+    '''
+    Search all the regexes (i.e. the predefined filters) in a single pass,
+    the hits of each regex are available (hits()) once finished and
+    their union (lines matching any of them) is emitted as a single search.
+    '''
+    __slots__ = ('_regexes', '_hits')
+    def __init__(self, fileBuffer, regexes, ignoreCase=False, start=0, end=None):
+        super().__init__(fileBuffer, '|'.join(regexes), ignoreCase, start, end=end)
+        self._regexes = regexes
+        self._hits = {}
+
+    def hits(self) -> dict:
+        '''Return the TloggHitSet of each regex'''
+        return self._hits
+
+    def _combine(self, hits, start, end) -> TloggHitSet:
+        return TloggHitSet.unionAll(hits.values())
+
+    def _batches(self):
+        hits = {regex:TloggHitSet() for regex in self._regexes}
+        end = self._fileBuffer.getIndexedLen()
+        if self._end is not None:
+            end = min(end, self._end)
+        for found, progress in self._fileBuffer.searchFiltersBatches(
+                                    self._regexes, self._ignoreCase, start=self._start, end=end):
+            for regex, indexes in found.items():
+                hits[regex].extend(indexes)
+            yield [], progress
+        self._hits = hits
+        if hits:
+            yield self._combine(hits, self._start, end).tolist(), 1.0
+
+class TloggQuerySearch(TloggFiltersSearch):
+    '''
+    Search the terms of a TloggQuery in a single pass (as the filters),
+    the lines matching the query are emitted as a single search.
+    '''
+    __slots__ = ('_query')
+    def __init__(self, fileBuffer, query, ignoreCase=False, start=0, end=None):
+        super().__init__(fileBuffer, query.terms(), ignoreCase, start, end)
+        self._query = query
+
+    def _combine(self, hits, start, end) -> TloggHitSet:
+        return self._query.evaluate(hits, start, end)
+
+class TloggGlobalSearch(TloggSearch):
+    '''
+    Search the same regex in many file buffers concurrently,
+    the ranges of all the files are searched in a single process pool,
+    shared by all the global searches, the hits are emitted with their file buffer.
+    '''
+    _pool = None
+    _poolWorkers = 0
+    _poolMutex = threading.Lock()
+
+    __slots__ = ('_fileBuffers', '_progress')
+    def __init__(self, fileBuffers, regex, ignoreCase=False):
+        super().__init__(None, regex, ignoreCase)
+        self._fileBuffers = fileBuffers
+        self._progress = [0.0]*len(fileBuffers)
+        # Signals
+        self.found = ttk.pyTTkSignal(TloggFileBuffer, list)
+
+    @staticmethod
+    def _sharedPool():
+        '''Return the (forked) process pool of the global searches, None if not available'''
+        workers = TloggFileBuffer._searchWorkers()
+        if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return None
+        with TloggGlobalSearch._poolMutex:
+            if TloggGlobalSearch._pool is None or TloggGlobalSearch._poolWorkers != workers:
+                if TloggGlobalSearch._pool is not None:
+                    TloggGlobalSearch._pool.shutdown(wait=False, cancel_futures=True)
+                TloggGlobalSearch._pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+                TloggGlobalSearch._poolWorkers = workers
+            return TloggGlobalSearch._pool
+
+    @staticmethod
+    def _dropPool(pool):
+        # A worker died, the pool is not usable anymore
+        with TloggGlobalSearch._poolMutex:
+            if TloggGlobalSearch._pool is pool:
+                TloggGlobalSearch._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _searchFile(self, pos, pool):
+        fileBuffer = self._fileBuffers[pos]
+        for indexes, progress in fileBuffer.searchReBatches(self._regex, self._ignoreCase, pool=pool):
+            # The emits of the threads are serialized (concurrent emits are dropped)
+            with self._lock:
+                if self._cancelled.is_set(): return
+                self._progress[pos] = progress
+                if indexes:
+                    self.found.emit(fileBuffer, indexes)
+                self.progress.emit(sum(self._progress)/len(self._progress))
+
+    def _run(self):
+        # A thread per file feeds the process pool with its ranges,
+        # the pending ranges of a cancelled search are dropped (see _searchParallel)
+        threads = None
+        try:
+            pool = TloggGlobalSearch._sharedPool()
+            threads = ThreadPoolExecutor(max(1,len(self._fileBuffers)))
+            futures = [threads.submit(self._searchFile, pos, pool) for pos in range(len(self._fileBuffers))]
+            for fileBuffer, future in zip(self._fileBuffers, futures):
+                try:
+                    future.result()
+                except re.error as e:
+                    ttk.TTkLog.error(f"Search RE: {self._regex} - {e}")
+                except BrokenProcessPool as e:
+                    TloggGlobalSearch._dropPool(pool)
+                    ttk.TTkLog.error(f"Search: {fileBuffer.filename()} - {e}")
+                except Exception as e:
+                    ttk.TTkLog.error(f"Search: {fileBuffer.filename()} - {e}")
+        except Exception as e:
+            ttk.TTkLog.error(f"Search: {self._regex} - {e}")
+        finally:
+            if threads is not None:
+                threads.shutdown(wait=False, cancel_futures=True)
+            with self._lock:
+                if not self._cancelled.is_set():
+                    self.finished.emit()
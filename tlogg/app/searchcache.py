@@ -0,0 +1,104 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggSearchCache']
+
+import threading
+from collections import OrderedDict
+
+from .cfg import TloggCfg
+
+class TloggSearchCache():
+    '''
+    Search results cache shared by all the opened files
+
+    A single LRU bounded by options['searchCacheSize'] (bytes, default 16M);
+    the entries are keyed by (owner, regex, ignoreCase) where owner
+    identifies the file buffer, each entry stores the sorted hits (array)
+    and the version of the file searched: its inode and the number of lines.
+    '''
+    _entries  = OrderedDict()
+    _mutex    = threading.Lock()
+    _resident = 0
+    _hits      = 0
+    _misses    = 0
+    _evictions = 0
+
+    @staticmethod
+    def budget() -> int:
+        return TloggCfg.options.get('searchCacheSize', 0x1000000)
+
+    @staticmethod
+    def _size(entry) -> int:
+        _, _, hits = entry
+        return len(hits)*hits.itemsize
+
+    @staticmethod
+    def get(owner, regex, ignoreCase, inode):
+        '''Return the (hits, lines) searched in the file with this inode, None if not cached'''
+        key = (owner, regex, ignoreCase)
+        with TloggSearchCache._mutex:
+            if (entry := TloggSearchCache._entries.get(key)) is None or entry[0] != inode:
+                TloggSearchCache._misses += 1
+                return None
+            TloggSearchCache._hits += 1
+            TloggSearchCache._entries.move_to_end(key)
+            return entry[2], entry[1]
+
+    @staticmethod
+    def put(owner, regex, ignoreCase, inode, hits, lines):
+        '''Store the sorted hits (array) found in the first "lines" lines of the file'''
+        entry = (inode, lines, hits)
+        if (size := TloggSearchCache._size(entry)) > TloggSearchCache.budget():
+            return
+        key = (owner, regex, ignoreCase)
+        with TloggSearchCache._mutex:
+            TloggSearchCache._remove(key)
+            TloggSearchCache._entries[key] = entry
+            TloggSearchCache._resident += size
+            budget = TloggSearchCache.budget()
+            while TloggSearchCache._resident > budget and len(TloggSearchCache._entries) > 1:
+                _,oldest = TloggSearchCache._entries.popitem(last=False)
+                TloggSearchCache._resident -= TloggSearchCache._size(oldest)
+                TloggSearchCache._evictions += 1
+
+    @staticmethod
+    def _remove(key):
+        if (entry := TloggSearchCache._entries.pop(key, None)) is not None:
+            TloggSearchCache._resident -= TloggSearchCache._size(entry)
+
+    @staticmethod
+    def invalidate(owner):
+        '''Drop all the entries of the owner'''
+        with TloggSearchCache._mutex:
+            for k in [k for k in TloggSearchCache._entries if k[0]==owner]:
+                TloggSearchCache._remove(k)
+
+    @staticmethod
+    def stats() -> dict:
+        return {
+            'hits'      : TloggSearchCache._hits,
+            'misses'    : TloggSearchCache._misses,
+            'evictions' : TloggSearchCache._evictions,
+            'entries'   : len(TloggSearchCache._entries),
+            'resident'  : TloggSearchCache._resident,
+            'budget'    : TloggSearchCache.budget()}
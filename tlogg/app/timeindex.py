@@ -0,0 +1,276 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggTimeIndex']
+
+import os
+import re
+import json
+import calendar
+from array import array
+from bisect import bisect_left
+
+from .cfg import TloggCfg
+from .indexcache import TloggIndexCache
+
+'''
+    Sparse time to line index
+
+    A timestamp is sampled every _step lines (or the first line with a
+    timestamp among the following _probes ones) once the file is indexed,
+    the first line with a time >= t is found by bisection of the samples
+    and a scan of the lines between the two closest samples.
+
+    A file without timestamps in the first _maxMissed steps is not
+    sampled any further (untimed), the cost is bounded for any file.
+
+    The timestamps are extracted by the first matching regex of
+    options['timestampFormats'], the named groups
+        year, month, day, hour, minute, second, fraction
+    are converted to seconds (since the epoch if the date is included,
+    since the midnight otherwise).
+
+    The times without date crossing the midnight (going back more than
+    half day) are moved to the next day, the samples are kept sorted.
+
+    The samples are stored along the line index cache (see TloggIndexCache),
+    a cached file is not sampled again when reopened.
+
+    Sidecar file layout (stored in <pathCfg>/index/<sha1(abspath)>.tim)
+
+    | MAGIC | header len (8 bytes LE) | json header | lines | times |
+
+    The header contains the identity of the indexed file (see TloggIndexCache),
+    the formats/step used, the sampling state and the number of samples.
+'''
+_formats = [
+    # 2024-01-31 14:32:05.123 / 2024-01-31T14:32:05,123
+    r'(?P<year>\d{4})-(?P<month>\d\d)-(?P<day>\d\d)[T ](?P<hour>\d\d):(?P<minute>\d\d)(?::(?P<second>\d\d)(?:[.,](?P<fraction>\d+))?)?',
+    # TEST;14:32:05;  (tools/create_log.py)
+    r'^\w+;(?P<hour>\d+):(?P<minute>\d\d):(?P<second>\d\d);',
+    # {"time": "14:32:05", ... (tools/create_log.py)
+    r'"time": ?"(?P<hour>\d+):(?P<minute>\d\d):(?P<second>\d\d)',
+    # Jan 31 14:32:05 (syslog)
+    r'^\w{3} [ \d]\d (?P<hour>\d\d):(?P<minute>\d\d):(?P<second>\d\d)\b']
+
+_day = 86400
+
+def _seconds(m):
+    '''Return the seconds of the matched timestamp and True if it includes the date'''
+    g = m.groupdict()
+    seconds = ( int(g.get('hour') or 0)*3600 + int(g.get('minute') or 0)*60 +
+                int(g.get('second') or 0) )
+    if fraction := g.get('fraction'):
+        seconds += int(fraction)/10**len(fraction)
+    if g.get('year') and g.get('month') and g.get('day'):
+        return seconds + calendar.timegm((int(g['year']), int(g['month']), int(g['day']), 0, 0, 0)), True
+    return seconds, False
+
+class TloggTimeIndex():
+    _magic   = b'TLOGGTIM'
+    _version = 2
+    _maxLength = 0x100 # The timestamp is searched at the beginning of the line
+    _probes    = 8     # Lines probed for a timestamp in each step
+    _maxMissed = 0x20  # Steps without timestamps before the file is considered untimed
+
+    __slots__ = ('_formats', '_step', '_lines', '_times', '_dated', '_next', '_missing', '_missed')
+    def __init__(self, formats=None, step=0x100):
+        self._formats = [re.compile(f) for f in (formats or _formats)]
+        self._step  = step
+        # The sampled lines and their times (sorted)
+        self._lines = array('Q')
+        self._times = array('d')
+        self._dated = False
+        # The next line to be sampled, None if untimed
+        self._next  = 0
+        # The lines probed in the current step and the steps without timestamps
+        self._missing = 0
+        self._missed  = 0
+
+    @staticmethod
+    def fromOptions():
+        '''Return an empty index configured by the options, None if disabled'''
+        if not TloggCfg.options.get('timeIndex', True):
+            return None
+        return TloggTimeIndex(TloggCfg.options.get('timestampFormats'),
+                              TloggCfg.options.get('timeIndexStep', 0x100))
+
+    def __len__(self):
+        return len(self._lines)
+
+    def parse(self, text):
+        '''Return the (seconds, dated) of the timestamp in the text, None if not found'''
+        text = text[:self._maxLength]
+        for rr in self._formats:
+            if m := rr.search(text):
+                return _seconds(m)
+        return None
+
+    def _normalize(self, seconds, dated, ref):
+        '''Move the time without date in the day closest to the reference time'''
+        if ref is None or self._dated == dated and dated:
+            return seconds
+        if dated:
+            # The date is ignored if the samples don't have it
+            seconds %= _day
+        base = ref - ref%_day
+        seconds += base
+        if seconds < ref - _day/2:
+            seconds += _day
+        elif seconds >= ref + _day/2:
+            seconds -= _day
+        return seconds
+
+    def time(self, text, ref=None):
+        '''Return the time of the line (normalized around ref) or None'''
+        if (parsed := self.parse(text)) is None:
+            return None
+        return self._normalize(*parsed, ref)
+
+    def nextSample(self):
+        '''Return the next line to be sampled, None if the file is untimed'''
+        return self._next
+
+    def add(self, line, text):
+        '''Add the sample of "line" (the one requested by nextSample)'''
+        if (parsed := self.parse(text)) is None:
+            # Try a few following lines, then the next step
+            self._missing += 1
+            if self._missing < min(self._probes, self._step):
+                self._next = line+1
+                return
+            self._missing = 0
+            self._missed += 1
+            if not self._times and self._missed >= self._maxMissed:
+                self._next = None
+            else:
+                self._next = line-line%self._step+self._step
+            return
+        seconds, dated = parsed
+        if not self._times:
+            self._dated = dated
+        else:
+            last = self._times[-1]
+            seconds = max(last, self._normalize(seconds, dated, last))
+        self._lines.append(line)
+        self._times.append(seconds)
+        self._missing = 0
+        self._missed  = 0
+        self._next = line-line%self._step+self._step
+
+    def toTime(self, text):
+        '''
+        Return the time (as the samples) of the typed text (i.e. "14:32"),
+        a time without date is the first one since the first sample, None if not valid
+        '''
+        text = text.strip()
+        if (m := re.fullmatch(r'(?:(?P<year>\d{4})-(?P<month>\d\d)-(?P<day>\d\d)[T ])?'
+                              r'(?P<hour>\d\d?):(?P<minute>\d\d)(?::(?P<second>\d\d)(?:[.,](?P<fraction>\d+))?)?', text)) is None:
+            return None
+        seconds, dated = _seconds(m)
+        if not self._times or (dated and self._dated):
+            return seconds
+        first = self._times[0]
+        if dated:
+            seconds %= _day
+        seconds += first - first%_day
+        if seconds < first:
+            seconds += _day
+        return seconds
+
+    def bracket(self, time):
+        '''
+        Return the (first, last, ref) lines to be scanned for the first line
+        with a time >= "time", last is None if unknown (after the last sample),
+        ref is the time used to normalize the scanned lines
+        '''
+        if not self._times:
+            return 0, None, None
+        pos = bisect_left(self._times, time)
+        if pos == 0:
+            return 0, self._lines[0], self._times[0]
+        last = self._lines[pos] if pos < len(self._lines) else None
+        return self._lines[pos-1], last, self._times[pos-1]
+
+    def _state(self) -> dict:
+        return {'formats' : [rr.pattern for rr in self._formats],
+                'step'    : self._step,
+                'dated'   : self._dated,
+                'next'    : self._next,
+                'missing' : self._missing,
+                'missed'  : self._missed,
+                'samples' : len(self._lines)}
+
+    @staticmethod
+    def load(filename, size):
+        '''
+        Return the index (configured by the options) stored for the file,
+        None if disabled, missing or outdated, "size" are the bytes indexed
+        '''
+        if not TloggIndexCache.enabled() or (ret := TloggTimeIndex.fromOptions()) is None:
+            return None
+        cachePath = TloggIndexCache._cachePath(filename, 'tim')
+        if not os.path.isfile(cachePath): return None
+        try:
+            with open(cachePath, 'rb') as f:
+                if f.read(len(TloggTimeIndex._magic)) != TloggTimeIndex._magic:
+                    return None
+                headerLen = int.from_bytes(f.read(8), 'little')
+                header = json.loads(f.read(headerLen))
+                if ( header.get('version') != TloggTimeIndex._version or
+                     header['size'] > size or
+                     header['formats'] != [rr.pattern for rr in ret._formats] or
+                     header['step'] != ret._step or
+                     not TloggIndexCache._matches(header, filename) ):
+                    return None
+                ret._lines.fromfile(f, header['samples'])
+                ret._times.fromfile(f, header['samples'])
+                ret._dated   = header['dated']
+                ret._next    = header['next']
+                ret._missing = header['missing']
+                ret._missed  = header['missed']
+                return ret
+        except (OSError, ValueError, KeyError, EOFError):
+            return None
+
+    def save(self, filename, size):
+        '''Store the samples of the file, "size" are the bytes indexed'''
+        if not TloggIndexCache.enabled() or size < TloggIndexCache._minSize: return
+        cachePath = TloggIndexCache._cachePath(filename, 'tim')
+        try:
+            os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+            with open(filename, 'rb') as fd:
+                header = TloggIndexCache._fileInfo(fd, filename, size)
+            header['version'] = TloggTimeIndex._version
+            header |= self._state()
+            header = json.dumps(header).encode()
+            # Write to a temp file and move it to avoid partial sidecars
+            tmpPath = f"{cachePath}.{os.getpid()}.tmp"
+            with open(tmpPath, 'wb') as f:
+                f.write(TloggTimeIndex._magic)
+                f.write(len(header).to_bytes(8, 'little'))
+                f.write(header)
+                self._lines.tofile(f)
+                self._times.tofile(f)
+            os.replace(tmpPath, cachePath)
+        except OSError:
+            pass
@@ -0,0 +1,321 @@
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__all__ = ['TloggTrigramIndex']
+
+import os
+import re
+import json
+import mmap
+import multiprocessing
+from array import array
+from bisect import bisect_left
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor
+
+from .cfg import TloggCfg
+from .indexcache import TloggIndexCache
+from .prefilter import TloggPrefilter
+
+_lastByte  = itemgetter(slice(-1,None))
+_firstByte = itemgetter(slice(0,1))
+
+def _trigrams(data) -> array:
+    '''
+    Return the sorted (ASCII lowercase) trigrams in data, each one packed in 24 bits
+
+    The words (split by spaces) repeat a lot in the logs, the trigrams are
+    extracted once from the distinct words, padded by spaces (" ab", "ab ")
+    and joined by NULs (the windows across them contain a NUL), and from
+    the distinct pairs of chars around each space ("a b")
+    (a few trigrams not in data may be included, i.e. at the boundaries)
+    '''
+    words = data.lower().split(b' ')
+    # An empty word is a space (consecutive spaces)
+    spaced = {(a[0] if a else 0x20, 0x20, b[0] if b else 0x20)
+              for a, b in set(zip(map(_lastByte, words), map(_firstByte, words[1:])))}
+    joined = b' ' + b' \0 '.join(set(words)) + b' '
+    spaced.update(zip(joined, joined[1:], joined[2:]))
+    return array('I', sorted((a<<16)|(b<<8)|c for a,b,c in spaced))
+
+def _trigramBlocks(filename, offsets) -> list:
+    '''Worker, return the (isascii, trigrams) of each block between the consecutive offsets'''
+    ret = []
+    with open(filename,'rb') as infile:
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for start, end in zip(offsets, offsets[1:]):
+                data = mm[start:end]
+                ret.append((data.isascii(), _trigrams(data)))
+    return ret
+
+'''
+    Opt-in (options['trigramIndex']) persistent trigram index of the blocks of a file
+
+    The complete lines are split in blocks of ~options['trigramBlockSize']
+    bytes (default 1M), for each trigram (3 bytes, ASCII lowercase)
+    the sorted list of the blocks containing it (posting list).
+
+    A regex can match only in the blocks containing all the trigrams of
+    at least one of its required literals (see TloggPrefilter),
+    the other blocks are not searched.
+
+    The trigrams found in more than _commonRatio of the blocks do not
+    narrow the search, only their keys are stored (commons).
+    The blocks with non ASCII bytes are candidates for any case insensitive
+    search (i.e. the Kelvin sign matches "k").
+
+    Sidecar file layout (stored in <pathCfg>/index/<sha1(abspath)>.tri)
+
+    | MAGIC | header len (8 bytes LE) | json header |
+    | offsets | lines | nonAscii | commons | keys | starts | postings |
+
+    The header contains the identity of the indexed file (see TloggIndexCache)
+    and the length of each array.
+'''
+class TloggTrigramIndex():
+    _magic   = b'TLOGGTRI'
+    _version = 1
+    _minSize = 0x100000 # Don't bother indexing files smaller than 1M
+    _commonRatio = 0.5
+    _batch   = 0x20 # Blocks indexed by each worker task
+    _arrays  = (('offsets', 'Q'), ('lines', 'Q'), ('nonAscii', 'I'), ('commons', 'I'),
+                ('keys', 'I'), ('starts', 'Q'), ('postings', 'I'))
+
+    __slots__ = ('_offsets', '_lines', '_nonAscii', '_commons', '_keys', '_starts', '_postings')
+    def __init__(self, offsets, lines, nonAscii, commons, keys, starts, postings):
+        # offsets/lines of the blocks boundaries, the last ones are the end of the index
+        self._offsets  = offsets
+        self._lines    = lines
+        self._nonAscii = nonAscii
+        self._commons  = commons
+        # The postings of keys[i] are postings[starts[i]:starts[i+1]]
+        self._keys     = keys
+        self._starts   = starts
+        self._postings = postings
+
+    @staticmethod
+    def enabled() -> bool:
+        return TloggCfg.options.get('trigramIndex', False)
+
+    @staticmethod
+    def blockSize() -> int:
+        return TloggCfg.options.get('trigramBlockSize', 0x100000)
+
+    def size(self) -> int:
+        '''Return the bytes indexed'''
+        return self._offsets[-1]
+
+    def lineCount(self) -> int:
+        '''Return the lines indexed'''
+        return self._lines[-1]
+
+    def blockCount(self) -> int:
+        return len(self._offsets)-1
+
+    def memoryUsage(self) -> int:
+        return sum(len(a)*a.itemsize for a in (
+            self._offsets, self._lines, self._nonAscii, self._commons,
+            self._keys, self._starts, self._postings))
+
+    @staticmethod
+    def _collect(filename, offsets, workers, first=0):
+        '''
+        Return the postings {trigram: blocks} and the non ASCII blocks
+        of the blocks between the consecutive offsets, numbered from "first"
+        '''
+        blocks = len(offsets)-1
+        batch = TloggTrigramIndex._batch
+        tasks = [offsets[i:i+batch+1] for i in range(0, blocks, batch)]
+        postings = {}
+        nonAscii = array('I')
+        def _add(results):
+            block = first
+            for result in results:
+                for isascii, trigrams in result:
+                    if not isascii:
+                        nonAscii.append(block)
+                    for trigram in trigrams:
+                        if (posting := postings.get(trigram)) is None:
+                            postings[trigram] = posting = array('I')
+                        posting.append(block)
+                    block += 1
+        if workers > 1 and len(tasks) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(min(workers,len(tasks)), mp_context=ctx) as pool:
+                _add(pool.map(_trigramBlocks, [filename]*len(tasks), tasks))
+        else:
+            _add(_trigramBlocks(filename, t) for t in tasks)
+        return postings, nonAscii
+
+    @staticmethod
+    def _pack(offsets, lines, nonAscii, commons, postings):
+        maxBlocks = (len(offsets)-1)*TloggTrigramIndex._commonRatio
+        commons = set(commons)
+        keys, starts, flat = array('I'), array('Q',[0]), array('I')
+        for trigram in sorted(postings):
+            posting = postings[trigram]
+            if len(posting) > maxBlocks:
+                commons.add(trigram)
+            else:
+                keys.append(trigram)
+                flat.extend(posting)
+                starts.append(len(flat))
+        return TloggTrigramIndex(offsets, lines, nonAscii, array('I', sorted(commons)), keys, starts, flat)
+
+    @staticmethod
+    def build(filename, offsets, lines, workers=1):
+        '''
+        Index the blocks between the consecutive offsets (aligned to the lines),
+        "lines" are the first line of each block (+ the lines indexed)
+        '''
+        postings, nonAscii = TloggTrigramIndex._collect(filename, offsets, workers)
+        return TloggTrigramIndex._pack(array('Q', offsets), array('Q', lines), nonAscii, (), postings)
+
+    def extend(self, filename, offsets, lines, workers=1):
+        '''
+        Return a new index with the blocks appended to the file indexed
+        (see build(), offsets[0] and lines[0] are the end of this index),
+        only the new blocks are read, the common trigrams stay common
+        '''
+        postings, nonAscii = TloggTrigramIndex._collect(filename, offsets, workers, self.blockCount())
+        starts = self._starts
+        for pos, trigram in enumerate(self._keys):
+            posting = self._postings[starts[pos]:starts[pos+1]]
+            if (new := postings.get(trigram)) is not None:
+                posting.extend(new)
+            postings[trigram] = posting
+        for trigram in self._commons:
+            postings.pop(trigram, None)
+        return TloggTrigramIndex._pack(self._offsets[:-1] + array('Q', offsets),
+                                       self._lines[:-1] + array('Q', lines),
+                                       self._nonAscii + nonAscii, self._commons, postings)
+
+    def _blocks(self, trigram):
+        '''Return the blocks containing the trigram, None if it is too common'''
+        keys = self._keys
+        if (pos := bisect_left(keys, trigram)) < len(keys) and keys[pos] == trigram:
+            return self._postings[self._starts[pos]:self._starts[pos+1]]
+        commons = self._commons
+        if (pos := bisect_left(commons, trigram)) < len(commons) and commons[pos] == trigram:
+            return None
+        return array('I')
+
+    def candidates(self, rrs):
+        '''
+        Return the sorted blocks where any of the compiled regexes may match,
+        None if the index can not narrow the search (any block may match)
+        '''
+        ret = set()
+        ignoreCase = False
+        for rr in rrs:
+            if (literals := TloggPrefilter.requiredLiterals(rr)) is None:
+                return None
+            if rr.flags & re.IGNORECASE:
+                # The index is lowercase only for the ASCII chars
+                if not all(l.isascii() for l in literals):
+                    return None
+                ignoreCase = True
+            literals = [l.encode().lower() for l in literals]
+            if min(map(len, literals)) < 3:
+                return None
+            for literal in literals:
+                trigrams = {(a<<16)|(b<<8)|c for a,b,c in zip(literal, literal[1:], literal[2:])}
+                postings = [p for p in map(self._blocks, trigrams) if p is not None]
+                if not postings:
+                    return None
+                # Start from the shortest posting list
+                blocks = set(min(postings, key=len))
+                for posting in postings:
+                    if not blocks: break
+                    blocks.intersection_update(posting)
+                ret |= blocks
+        if ignoreCase:
+            ret.update(self._nonAscii)
+        return sorted(ret)
+
+    def runs(self, blocks, start, end) -> list:
+        '''
+        Return the [first,last) runs of lines within [start,end) of the sorted blocks,
+        the lines after the ones indexed are always included
+        '''
+        ret = []
+        def _add(first, last):
+            first, last = max(start, first), min(end, last)
+            if first >= last: return
+            if ret and ret[-1][1] == first:
+                ret[-1] = (ret[-1][0], last)
+            else:
+                ret.append((first, last))
+        lines = self._lines
+        for block in blocks:
+            _add(lines[block], lines[block+1])
+        _add(lines[-1], end)
+        return ret
+
+    @staticmethod
+    def load(filename):
+        '''Return the index stored for the file or None if missing/outdated'''
+        if not TloggTrigramIndex.enabled(): return None
+        cachePath = TloggIndexCache._cachePath(filename, 'tri')
+        if not os.path.isfile(cachePath): return None
+        try:
+            with open(cachePath, 'rb') as f:
+                if f.read(len(TloggTrigramIndex._magic)) != TloggTrigramIndex._magic:
+                    return None
+                headerLen = int.from_bytes(f.read(8), 'little')
+                header = json.loads(f.read(headerLen))
+                if header.get('version') != TloggTrigramIndex._version:
+                    return None
+                if not TloggIndexCache._matches(header, filename):
+                    return None
+                arrays = []
+                for name, typecode in TloggTrigramIndex._arrays:
+                    arrays.append(a := array(typecode))
+                    a.fromfile(f, header[name])
+                return TloggTrigramIndex(*arrays)
+        except (OSError, ValueError, KeyError, EOFError):
+            return None
+
+    def save(self, filename):
+        if not TloggTrigramIndex.enabled(): return
+        cachePath = TloggIndexCache._cachePath(filename, 'tri')
+        arrays = (self._offsets, self._lines, self._nonAscii, self._commons,
+                  self._keys, self._starts, self._postings)
+        try:
+            os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+            with open(filename, 'rb') as fd:
+                header = TloggIndexCache._fileInfo(fd, filename, self.size())
+            header['version'] = TloggTrigramIndex._version
+            for (name, _), a in zip(TloggTrigramIndex._arrays, arrays):
+                header[name] = len(a)
+            header = json.dumps(header).encode()
+            # Write to a temp file and move it to avoid partial sidecars
+            tmpPath = f"{cachePath}.{os.getpid()}.tmp"
+            with open(tmpPath, 'wb') as f:
+                f.write(TloggTrigramIndex._magic)
+                f.write(len(header).to_bytes(8, 'little'))
+                f.write(header)
+                for a in arrays:
+                    a.tofile(f)
+            os.replace(tmpPath, cachePath)
+        except OSError:
+            pass
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Indexing throughput (MB/s) for different worker counts
+#
+# use: tools/bench.index.py <FILENAME> [WORKERS ...]
+#      (the file can be generated with tools/create_log.py)
+
+import os
+import sys
+import time
+import threading
+
+sys.path.append(os.path.join(sys.path[0],'..'))
+
+from tlogg.app.cfg import TloggCfg
+from tlogg.app.filebuffer import TloggFileBuffer
+
+if len(sys.argv) < 2 :
+	print ("Missing filename")
+	print ("use %s <FILENAME> [WORKERS ...]" % sys.argv[0])
+	exit(1)
+
+filename = sys.argv[1]
+workers  = [int(w) for w in sys.argv[2:]] or [1,2,4,8,16,32]
+fileSize = os.stat(filename).st_size
+
+# Always index the whole file
+TloggCfg.options['indexCache'] = False
+
+print(f"File: {filename} {fileSize/0x100000:.1f} MB, {os.cpu_count()} cpus")
+for w in workers:
+	TloggCfg.options['indexWorkers'] = w
+	done = threading.Event()
+	start = time.time()
+	fb = TloggFileBuffer(filename)
+	fb.indexed.connect(done.set)
+	done.wait()
+	elapsed = time.time()-start
+	mem, bpl = fb.indexMemoryUsage()
+	print(f"workers={w:3d} lines={fb.getLen()} time={elapsed:.3f}s {fileSize/0x100000/elapsed:8.1f} MB/s index={mem/0x100000:.1f} MB ({bpl:.2f} bytes/line)")
+
+os._exit(0)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Highlighter rules matching (per rule findall vs the combined engine)
+# and FileViewer paint throughput (frames/s) scrolling the file
+# back and forth, with and without the rendered lines cache
+#
+# use: tools/bench.paint.py <FILENAME> [RULES] [COLORS.yaml]
+#      (the file can be generated with tools/create_log.py,
+#       the rules are the ones in COLORS.yaml (default tools/test.config/colors.yaml)
+#       + synthetic rules up to RULES (default 40))
+
+import os
+import sys
+import time
+import threading
+
+import yaml
+
+sys.path.append(os.path.join(sys.path[0],'..'))
+
+import TermTk as ttk
+
+from tlogg.app.cfg import TloggCfg
+from tlogg.app.filebuffer import TloggFileBuffer
+from tlogg.app.fileviewer import FileViewer
+from tlogg.app.highlighter import TloggHighlighter
+
+if len(sys.argv) < 2 :
+	print ("Missing filename")
+	print ("use %s <FILENAME> [RULES] [COLORS.yaml]" % sys.argv[0])
+	exit(1)
+
+filename  = sys.argv[1]
+numRules  = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+colorsCfg = sys.argv[3] if len(sys.argv) > 3 else os.path.join(sys.path[0],'test.config','colors.yaml')
+
+with open(colorsCfg) as f:
+	rules = yaml.load(f, Loader=yaml.SafeLoader)['cfg']
+# Synthetic rules (klogg like), rarely matching, the worst case
+for i in range(len(rules), numRules):
+	rules.append({
+		'pattern':[f'ERROR{i}', rf'\bwarn{i}\b', f'Exception in thread "{i}"', rf'^\[{i}\]', rf'id=0x{i:04x}\s'][i%5],
+		'ignorecase':i%2==0, 'fg':'#ffffff', 'bg':'#ff0000'})
+TloggCfg.colors = rules[:numRules]
+TloggHighlighter.invalidate()
+
+def _legacy(text):
+	# The previous per rule loop
+	line = ttk.TTkString(text)
+	for color in TloggCfg.colors:
+		if line.findall(regexp=color['pattern'], ignoreCase=color['ignorecase']):
+			return color
+	return None
+
+done = threading.Event()
+fb = TloggFileBuffer(filename)
+fb.indexed.connect(done.set)
+done.wait()
+
+lines = [str(ttk.TTkString(fb.getLine(i).replace('\n','')).tab2spaces()) for i in range(min(fb.getLen(), 20000))]
+print(f"File: {filename} {fb.getLen()} lines, {len(TloggCfg.colors)} rules")
+
+start = time.time()
+legacy = [_legacy(l) for l in lines]
+tLegacy = time.time()-start
+start = time.time()
+engine = [TloggHighlighter.match(l) for l in lines]
+tEngine = time.time()-start
+assert legacy == engine
+print(f"match:  lines={len(lines)} legacy={tLegacy:.3f}s ({len(lines)/tLegacy:9.0f} lines/s) "
+      f"engine={tEngine:.3f}s ({len(lines)/tEngine:9.0f} lines/s) x{tLegacy/tEngine:.2f}")
+
+def _paint(frames, cached, width=200, height=60):
+	view = FileViewer(filebuffer=fb)
+	view.resize(width, height)
+	canvas = ttk.TTkCanvas(width=width, height=height)
+	start = time.time()
+	for frame in range(frames):
+		# Scroll back and forth over the same region
+		view.viewMoveTo(0, (frame*7)%max(1,min(fb.getLen(),2000)-height))
+		if not cached:
+			view._rendered.clear()
+		view.paintEvent(canvas)
+	return frames/(time.time()-start)
+
+engineMatch = TloggHighlighter.match
+for name, match, cached in (
+		('legacy', _legacy,     False),
+		('engine', engineMatch, False),
+		('cached', engineMatch, True)):
+	TloggHighlighter.match = staticmethod(match)
+	print(f"paint:  {name:6} {_paint(200, cached):7.1f} frames/s")
+TloggHighlighter.match = staticmethod(engineMatch)
+
+os._exit(0)
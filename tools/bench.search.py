@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Search time decoding all the lines, with the literal prefilter
+# and matching the raw bytes (+ prefilter), the results cache is
+# invalidated before each run, the cached search is measured apart
+#
+# use: tools/bench.search.py <FILENAME> [PATTERN ...]
+#      (the file can be generated with tools/create_log.py)
+
+import os
+import re
+import sys
+import time
+import threading
+
+sys.path.append(os.path.join(sys.path[0],'..'))
+
+from tlogg.app.cfg import TloggCfg
+from tlogg.app.filebuffer import TloggFileBuffer
+from tlogg.app.prefilter import TloggPrefilter
+from tlogg.app.searchcache import TloggSearchCache
+
+if len(sys.argv) < 2 :
+	print ("Missing filename")
+	print ("use %s <FILENAME> [PATTERN ...]" % sys.argv[0])
+	exit(1)
+
+filename = sys.argv[1]
+patterns = sys.argv[2:] or [
+	'BROKEN', 'BROKEN LINE', 'Excepteur sint', '(cupidatat|Excepteur) non',
+	r'\blaborum\.\s*"', 'LIN=0[0-9A-F]AB', 'sentence[0-9]": "Duis', r'COL4;LIN=\w+\s']
+fileSize = os.stat(filename).st_size
+
+# Single process, only the search paths are measured
+TloggCfg.options['searchWorkers'] = 1
+TloggCfg.options['indexCache'] = False
+
+done = threading.Event()
+fb = TloggFileBuffer(filename)
+fb.indexed.connect(done.set)
+done.wait()
+
+def _search(pattern, ignoreCase, prefilter, bytesSearch, cached=False):
+	TloggCfg.options['searchPrefilter'] = prefilter
+	TloggCfg.options['searchBytes'] = bytesSearch
+	if not cached:
+		TloggSearchCache.invalidate(fb._cacheId)
+	start = time.time()
+	ret = fb.searchRe(pattern, ignoreCase)
+	return ret, time.time()-start
+
+print(f"File: {filename} {fileSize/0x100000:.1f} MB, {fb.getLen()} lines")
+for pattern in patterns:
+	for ignoreCase in (False, True):
+		pf = TloggPrefilter.fromRegex(re.compile(pattern, re.IGNORECASE if ignoreCase else 0))
+		full, tFull = _search(pattern, ignoreCase, False, False)
+		pref, tPref = _search(pattern, ignoreCase, True,  False)
+		byts, tByts = _search(pattern, ignoreCase, True,  True)
+		cach, tCach = _search(pattern, ignoreCase, True,  True, cached=True)
+		assert full == pref == byts == cach, pattern
+		literals = pf.literals() if pf else None
+		print(f"{pattern:30} icase={ignoreCase!s:5} hits={len(full):8} full={tFull:.3f}s "
+		      f"prefilter={tPref:.3f}s x{tFull/tPref:5.2f} bytes={tByts:.3f}s x{tFull/tByts:5.2f} {literals}")
+		print(f"{'':30} {'':10} cached={tCach:.3f}s (uncached bytes={tByts:.3f}s)")
+
+os._exit(0)
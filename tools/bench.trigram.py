@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# MIT License
+#
+# Copyright (c) 2023 Eugenio Parodi <ceccopierangiolieugenio AT googlemail DOT com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Trigram index build time and size (memory and sidecar file) for
+# different block sizes versus the search speedup of each pattern
+#
+# use: tools/bench.trigram.py <FILENAME> [BLOCKSIZE_KB ...] [-- PATTERN ...]
+#      (the file can be generated with tools/create_log.py)
+
+import os
+import re
+import sys
+import time
+import tempfile
+import threading
+
+sys.path.append(os.path.join(sys.path[0],'..'))
+
+from tlogg.app.cfg import TloggCfg
+from tlogg.app.filebuffer import TloggFileBuffer
+from tlogg.app.indexcache import TloggIndexCache
+from tlogg.app.searchcache import TloggSearchCache
+from tlogg.app.trigramindex import TloggTrigramIndex
+
+if len(sys.argv) < 2 :
+	print ("Missing filename")
+	print ("use %s <FILENAME> [BLOCKSIZE_KB ...] [-- PATTERN ...]" % sys.argv[0])
+	exit(1)
+
+filename = sys.argv[1]
+args     = sys.argv[2:]
+patterns = args[args.index('--')+1:] if '--' in args else []
+args     = args[:args.index('--')] if '--' in args else args
+blockSizes = [int(b)*0x400 for b in args] or [0x10000, 0x40000, 0x100000, 0x400000]
+patterns = patterns or [
+	'BROKEN LINE', 'END LINE', 'Excepteur sint', 'LIN=0123', 'LIN=01234',
+	'RND=0.12345', 'zzzqqq', '(cupidatat|Excepteur) non', 'Kelvin']
+fileSize = os.stat(filename).st_size
+
+# The index is built here, the sidecar is stored in a temporary folder
+TloggCfg.options['trigramIndex'] = True
+TloggCfg.options['indexCache'] = False
+TloggCfg.options['searchWorkers'] = 1
+TloggCfg.pathCfg = tempfile.mkdtemp()
+
+TloggCfg.options['trigramBlockSize'] = fileSize
+done = threading.Event()
+fb = TloggFileBuffer(filename)
+fb.indexed.connect(done.set)
+done.wait()
+fb._trigrams = None
+
+def _search(pattern, ignoreCase, trigrams, runs=3):
+	# The best of "runs" searches
+	fb._trigrams = trigrams
+	best = None
+	for _ in range(runs):
+		TloggSearchCache.invalidate(fb._cacheId)
+		start = time.time()
+		ret = fb.searchRe(pattern, ignoreCase)
+		elapsed = time.time()-start
+		best = elapsed if best is None else min(best, elapsed)
+	return ret, best
+
+print(f"File: {filename} {fileSize/0x100000:.1f} MB, {fb.getLen()} lines")
+# Warm up the page cache
+_search(patterns[0], False, None, 1)
+full = {}
+for pattern in patterns:
+	for ignoreCase in (False, True):
+		full[(pattern, ignoreCase)] = _search(pattern, ignoreCase, None)
+
+lines = fb.getIndexedLen()-1
+size  = fb._indexes[lines]
+for blockSize in blockSizes:
+	start = time.time()
+	ranges = fb._searchRanges(0, lines, blockSize)
+	trigrams = TloggTrigramIndex.build(filename,
+	                                   [r[1] for r in ranges] + [size],
+	                                   [r[0] for r in ranges] + [lines],
+	                                   TloggFileBuffer._indexWorkers())
+	tBuild = time.time()-start
+	trigrams.save(filename)
+	sidecar = os.stat(TloggIndexCache._cachePath(filename, 'tri')).st_size
+	print(f"block={blockSize//0x400:5d}KB blocks={trigrams.blockCount():6d} build={tBuild:.2f}s "
+	      f"{fileSize/0x100000/tBuild:6.1f} MB/s memory={trigrams.memoryUsage()/0x100000:.2f} MB "
+	      f"file={sidecar/0x100000:.2f} MB ({100*sidecar/fileSize:.2f}%)")
+	for pattern in patterns:
+		for ignoreCase in (False, True):
+			hits, tFull = full[(pattern, ignoreCase)]
+			ret, tTri = _search(pattern, ignoreCase, trigrams)
+			assert ret == hits, pattern
+			blocks = trigrams.candidates([re.compile(pattern, re.IGNORECASE if ignoreCase else 0)])
+			blocks = 'all' if blocks is None else len(blocks)
+			print(f"   {pattern:30} icase={ignoreCase!s:5} hits={len(hits):8} blocks={blocks!s:>6} "
+			      f"full={tFull:.3f}s trigram={tTri:.3f}s x{tFull/max(tTri,1e-6):7.2f}")
+
+os._exit(0)